@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import threading
+import Versions
+
+# Push-driven cache invalidation. A change feed listens for writes to the app's tables, wherever
+# they're made, and bumps the table's version (see `Versions`) the moment one arrives, so cached
+# reads are fetched again on the next page view and never while nothing changes.
+
+logger = logging.getLogger(__name__)
+
+class ChangeFeed:
+    """Bumps a table's version whenever it's told the table changed."""
+
+    def __init__(self, tables=Versions.TABLES):
+        self.tables = tuple(tables)
+        self.live = False
+
+    def start(self):
+        """Starts listening for changes."""
+
+    def stop(self):
+        """Stops listening, cached reads fall back to expiring (see `Versions.FALLBACK_SECONDS`)."""
+        self._set_live(False)
+
+    def notify(self, table):
+        """Marks cached reads of `table` stale."""
+        if table in self.tables:
+            Versions.bump(table)
+
+    def _set_live(self, live):
+        # Anything could have changed while the feed wasn't live
+        if live and not self.live:
+            Versions.bump(*self.tables)
+        self.live = live
+        Versions.set_live(live)
+
+class LocalChangeFeed(ChangeFeed):
+    """
+    An in-process stand-in for a database's change notifications, for offline use and tests.
+    Whatever writes to the tables calls `publish`, e.g. `SQLiteRepository(feed=...)`.
+    """
+
+    def start(self):
+        self._set_live(True)
+
+    def publish(self, *tables):
+        """Announces that `tables` changed."""
+        if self.live:
+            for table in tables:
+                self.notify(table)
+
+class SupabaseChangeFeed(ChangeFeed):
+    """
+    Subscribes to Supabase Realtime changes of the tables on a background thread, reconnecting
+    after `retry_seconds` if the connection drops. The tables need adding to the
+    `supabase_realtime` publication, see sql/change_feed.sql.
+    """
+
+    def __init__(self, url, key, tables=Versions.TABLES, retry_seconds=30):
+        super().__init__(tables)
+        self.url = f"{url.rstrip('/')}/realtime/v1"
+        self.key = key
+        self.retry_seconds = retry_seconds
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        super().stop()
+
+    def _run(self):
+        asyncio.run(self._listen())
+
+    def _on_subscribe(self, state, error):
+        from realtime import RealtimeSubscribeStates
+
+        if error is not None:
+            logger.warning("Change feed subscription failed: %s", error)
+        self._set_live(state == RealtimeSubscribeStates.SUBSCRIBED)
+
+    async def _listen(self):
+        from realtime import AsyncRealtimeClient
+
+        while not self._stopped.is_set():
+            client = AsyncRealtimeClient(self.url, self.key, auto_reconnect=False)
+            try:
+                await client.connect()
+                channel = client.channel("euro-predictions-changes")
+                for table in self.tables:
+                    channel.on_postgres_changes("*", table=table, callback=lambda payload, table=table: self.notify(table))
+                await channel.subscribe(self._on_subscribe)
+                while client.is_connected and not self._stopped.is_set():
+                    await asyncio.sleep(1)
+            except Exception as e:
+                logger.warning("Change feed disconnected: %s", e)
+            finally:
+                # Anything written while reconnecting is only picked up once the versions roll over
+                self._set_live(False)
+                await client.close()
+            if not self._stopped.is_set():
+                await asyncio.sleep(self.retry_seconds)
+
+_feed = None
+
+def start(feed):
+    """Makes `feed` the process-wide change feed, stopping the one it replaces."""
+    global _feed
+    if _feed is not None and _feed is not feed:
+        _feed.stop()
+    _feed = feed
+    feed.start()
+    return feed
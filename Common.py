@@ -1,23 +1,37 @@
 import os
 import re
 import logging
+import functools
+import ChangeFeed
+import Repository
+import Instrumentation
 import streamlit as st
 from pathlib import Path
-from st_supabase_connection import SupabaseConnection
 
 logo_path = os.path.join(os.path.abspath(os.getcwd()), "resources", "logo.png")
 
-EMOJI_PATTERN = re.compile(
+EMOJI_PATTERN = (
     "[\U0001F600-\U0001F64F]|[\U0001F300-\U0001F5FF]|"
     "[\U0001F680-\U0001F6FF]|[\U0001F700-\U0001F77F]|"
     "[\U0001F780-\U0001F7FF]|[\U0001F800-\U0001F8FF]|"
     "[\U0001F900-\U0001F9FF]|[\U0001FA00-\U0001FA6F]|"
     "[\U0001FA70-\U0001FAFF]|[\U00002702-\U000027B0]|"
     "[\U000024C2-\U0001F251]|[\U0001f926-\U0001f937]|"
-    "[\U0001F1E0-\U0001F1FF]+",
-    flags=re.UNICODE,
+    "[\U0001F1E0-\U0001F1FF]+"
 )
 
+@functools.cache
+def _emoji_regex():
+    # Compiled on first use rather than when every page imports this module
+    return re.compile(EMOJI_PATTERN, flags=re.UNICODE)
+
+@st.cache_resource
+def _load_logo():
+    """The logo's bytes, read once per process, or None if there isn't one."""
+    if os.path.exists(logo_path):
+        return Path(logo_path).read_bytes()
+    return None
+
 def print_menu():
     """
     Prints the logo at the top of the Streamlit sidebar.
@@ -29,9 +43,9 @@ def print_menu():
     pil_logger.setLevel(logging.INFO)
 
     # draw the app header
-    if os.path.exists(logo_path):
+    image = _load_logo()
+    if image is not None:
         col_icon, col_title, _ = st.sidebar.columns([1.4, 2, 0.6])
-        image = Path(logo_path).read_bytes()
         col_icon.markdown("")
         col_icon.image(image, use_column_width=True)
         col_title.header('Euro 2024 Predictions')
@@ -39,6 +53,11 @@ def print_menu():
         col_title, _ = st.sidebar.columns([2, 0.8])
         st.sidebar.header('Euro 2024 Predictions')
 
+    # warn that nothing can be changed while serving a snapshot
+    repository = get_repository()
+    if repository.read_only:
+        st.sidebar.warning(f"Showing the snapshot at `{repository.path}`, read-only", icon="🧊")
+
     # draw available pages
     with st.sidebar:
         st.page_link("streamlit_app.py", label="Dashboard", icon="🏠")
@@ -49,11 +68,12 @@ def print_menu():
         if "is_admin" in st.session_state and st.session_state.is_admin:
             st.markdown("#### Administration")
             st.page_link("pages/Admin_Update_Scores.py", label="Update match scores", icon="🧮")
+            st.page_link("pages/Admin_Diagnostics.py", label="Diagnostics", icon="🩺")
 
 
 def get_first_emoji(text):
     # Find the first emoji in the text
-    match = re.search(EMOJI_PATTERN, text)
+    match = _emoji_regex().search(text)
 
     if match:
         return match.group()
@@ -91,11 +111,49 @@ def check_password():
     return False
 
 # Database
-st_supabase_client = st.connection(
-    name = "euro-predictions",
-    type = SupabaseConnection,
-    ttl = 300
-)
+_repository = None
+
+def get_repository():
+    """
+    Returns the process-wide `Repository` every page and `Database` query goes through.
+
+    The hosted Supabase database is used unless the `EURO_PREDICTIONS_BACKEND` environment
+    variable is set to `sqlite`, in which case the SQLite file at `EURO_PREDICTIONS_SQLITE_PATH`
+    (in memory if unset) is used instead, or to `parquet`, to serve the latest snapshot in
+    `EURO_PREDICTIONS_SNAPSHOT_DIR` (see `Snapshot`) read-only, e.g. while Supabase is down.
+
+    A change feed is started alongside it, so cached reads are refreshed as soon as the tables change,
+    and every query is traced for the diagnostics page (see `Instrumentation`). Supabase isn't
+    connected to until the first query.
+    """
+    global _repository
+    if _repository is None:
+        backend = os.environ.get("EURO_PREDICTIONS_BACKEND", "supabase")
+        if backend == "sqlite":
+            feed = ChangeFeed.start(ChangeFeed.LocalChangeFeed())
+            repository = Repository.SQLiteRepository(os.environ.get("EURO_PREDICTIONS_SQLITE_PATH", ":memory:"), feed=feed)
+        elif backend == "parquet":
+            import Snapshot
+
+            # A snapshot never changes, so cached reads of it never need refreshing
+            ChangeFeed.start(ChangeFeed.LocalChangeFeed())
+            repository = Repository.ParquetRepository(Snapshot.latest())
+        else:
+            repository = Repository.SupabaseRepository(_connect_supabase)
+        _repository = Instrumentation.InstrumentedRepository(repository)
+    return _repository
+
+def _connect_supabase():
+    # Importing the Supabase client and connecting is slow, so it's left until it's needed
+    from st_supabase_connection import SupabaseConnection
+    connection = st.connection(
+        name = "euro-predictions",
+        type = SupabaseConnection,
+    )
+    ChangeFeed.start(ChangeFeed.SupabaseChangeFeed(connection.client.supabase_url, connection.client.supabase_key))
+    return connection
 
-def get_database_client():
-    return st_supabase_client
+def set_repository(repository):
+    """Swaps the repository used by the app, e.g. for an offline `SQLiteRepository` in benchmarks."""
+    global _repository
+    _repository = repository
@@ -1,174 +1,716 @@
 import Common
+import Instrumentation
+import Scoring
+import Versions
+import Repository
+import threading
+import numpy as np
 import pandas as pd
 import streamlit as st
-from st_supabase_connection import execute_query
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-client = Common.get_database_client()
+####################################################################################################
+# Paging
+####################################################################################################
+
+# Most rows fetched per request. PostgREST may cap a page lower still, `Repository.stream` copes
+# with that by paging until it gets an empty page.
+CHUNK_SIZE = 10_000
+
+def stream_table(table, *columns, eq=None, chunk_size=CHUNK_SIZE):
+    """Yields `columns` of `table` as DataFrames of at most `chunk_size` rows, in key order."""
+    for rows in Common.get_repository().stream(table, *columns, eq=eq, chunk_size=chunk_size):
+        yield pd.DataFrame(rows)
+
+def stream_predictions(*columns, eq=None, chunk_size=CHUNK_SIZE):
+    """Yields the `predictions` table in chunks, ordered by (`member_id`, `match_number`)."""
+    return stream_table("predictions", *columns, eq=eq, chunk_size=chunk_size)
+
+def fetch_table(table, *columns, eq=None, chunk_size=CHUNK_SIZE):
+    """Pages through `table` like `stream_table`, returning all of the rows as one DataFrame."""
+    chunks = list(stream_table(table, *columns, eq=eq, chunk_size=chunk_size))
+    if not chunks:
+        key = Repository.TABLES[table]["key"]
+        return pd.DataFrame(columns=[*columns, *(column for column in key if column not in columns)])
+    return pd.concat(chunks, ignore_index=True)
+
+####################################################################################################
+# Snapshots
+####################################################################################################
+
+# The frames every page view reads are loaded once per version of their tables (see `Versions`)
+# and shared by all sessions with `st.cache_resource`, rather than `st.cache_data` unpickling a
+# fresh copy of them on every read. They're kept compact: teams, stages and groups are
+# categoricals, names Arrow strings, and goals and counts small nullable ints.
+#
+# Never change a snapshot, or a slice of its rows that may still be a view of it. Selecting
+# columns or filtering rows makes a copy, `df.assign` makes a new frame, anything else that hands
+# out part of a snapshot to be changed copies it explicitly (see `get_member_predictions`).
+
+# Dtypes of the table snapshots that differ from how the rows load
+TABLE_DTYPES = {
+    "points_ledger": {'member_id': 'int64', 'match_number': 'int64', 'category': 'category', 'hits': 'int64'},
+}
+
+def get_table(table):
+    """
+    Returns every row and column of `table` in key order, loaded with one query per version of
+    the table and shared by all sessions, so readers of the same table don't each query it.
+    Treat it as read-only.
+    """
+    return _get_table(table, Versions.get(table))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2 * len(Versions.TABLES)))
+def _get_table(table, version):
+    return fetch_table(table, *Repository.TABLES[table]["columns"]).astype(TABLE_DTYPES.get(table, {}))
+
+def prefetch(*tables):
+    """
+    Loads the snapshots of `tables` (see `get_table`) at the same time, one query per table, so a
+    page on a cold cache waits about as long as its slowest query rather than for all of them in
+    turn. Call it before reading them, tables already cached aren't fetched again.
+    """
+    ctx = get_script_run_ctx()
+    section = Instrumentation.current_section() or "Prefetch"
+
+    def load(table):
+        # Lets Streamlit's caches see the page's script run from the pool's threads, and tags
+        # the queries with the page section the prefetch was made in
+        add_script_run_ctx(threading.current_thread(), ctx)
+        with Instrumentation.section(f"{section} / {table}"):
+            get_table(table)
+
+    with ThreadPoolExecutor(max_workers=len(tables) or 1, thread_name_prefix="prefetch") as pool:
+        list(pool.map(load, dict.fromkeys(tables)))
+
+def compact_matches(df):
+    """Converts the columns of the `matches` table in `df` to the dtypes of a snapshot."""
+    teams = pd.CategoricalDtype(sorted(set(df['home'].dropna()) | set(df['away'].dropna())))
+    dtypes = {
+        'number': 'int16',
+        'date': 'category',
+        'time': 'category',
+        'home': teams,
+        'home_goals': 'Int8',
+        'away': teams,
+        'away_goals': 'Int8',
+        'group': 'category',
+        'stage': 'category',
+        'stadium': 'category',
+    }
+    return df.astype({column: dtype for column, dtype in dtypes.items() if column in df})
+
+####################################################################################################
+# Matches & Members
+####################################################################################################
+
+MATCH_COLUMNS = ["number", "date", "time", "home", "home_goals", "away", "away_goals", "group", "stage", "stadium"]
+
+def get_matches():
+    """
+    Returns every match, loaded once per version of the `matches` table and shared by all
+    sessions (see Snapshots). Treat it as read-only.
+    """
+    return _get_matches(Versions.get("matches"))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_matches(version):
+    return compact_matches(get_table("matches")[MATCH_COLUMNS])
+
+def format_score(home_goals, away_goals):
+    """Formats two columns of goals as "2 : 1" scores, missing where the goals are."""
+    return home_goals.astype('Int64').astype('string') + " : " + away_goals.astype('Int64').astype('string')
+
+def format_matches(df):
+    """Returns `df` with the `score`, `date`, `uk_time` and group-qualified `stage` display columns."""
+    home_goals, away_goals = df['home_goals'].astype('Int8'), df['away_goals'].astype('Int8')
+    stage = df['stage'].astype('string')
+    return df.assign(
+        home_goals=home_goals,
+        away_goals=away_goals,
+        score=format_score(home_goals, away_goals),
+        date=pd.to_datetime(df['date']).dt.strftime('%d %B'),
+        uk_time=pd.to_datetime(df['time'], format="mixed").dt.strftime('%H:%M'),
+        stage=stage.where(df['group'].isna(), stage + " " + df['group'].astype('string')).astype('category'),
+    )
+
+def get_fixtures():
+    """
+    Returns every match with its display columns, built once per version of the `matches` table
+    and shared by all sessions without copying. Treat it as read-only.
+    """
+    return _get_fixtures(Versions.get("matches"))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_fixtures(version):
+    return format_matches(_get_matches(version))
+
+def get_members():
+    return _get_members(Versions.get("members"))
+
+@Instrumentation.cached(st.cache_data(max_entries=4))
+def _get_members(version):
+    return Common.get_repository().select("members",
+        "id", "name", "winning_country",
+        order="name"
+    )
+
+####################################################################################################
+# Predictions
+####################################################################################################
+
+PREDICTION_COLUMNS = ["match_number", "home_goals_prediction", "away_goals_prediction", "home_team_prediction", "away_team_prediction"]
+
+@Instrumentation.cached(st.cache_data(max_entries=256))
+def _get_member_predictions(member_id, version):
+    return pd.DataFrame(Common.get_repository().select("predictions",
+        *PREDICTION_COLUMNS,
+        eq={"member_id": member_id},
+        order="match_number"
+    ), columns=PREDICTION_COLUMNS)
+
+def get_predictions_index():
+    """
+    Loads every member's predictions once, shared by all sessions.
+
+    Returns the predictions sorted by member and match, and a dict mapping each member id to the
+    (start, stop) rows holding their predictions.
+    """
+    return _get_predictions_index(Versions.get("predictions"))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_predictions_index(version):
+    predictions = fetch_table("predictions", *PREDICTION_COLUMNS)
+    member_ids, starts = np.unique(predictions['member_id'].to_numpy(), return_index=True)
+    stops = np.append(starts[1:], len(predictions))
+    return predictions[PREDICTION_COLUMNS], dict(zip(member_ids.tolist(), zip(starts.tolist(), stops.tolist())))
+
+def get_member_predictions(member_id, prefetch=False):
+    """
+    Returns a member's predictions ordered by match number.
+
+    With `prefetch`, everyone's predictions are loaded on the first call (see
+    `get_predictions_index`) and switching member is a lookup with no database query.
+    """
+    if not prefetch:
+        return _get_member_predictions(member_id, Versions.get("predictions"))
+    predictions, index = get_predictions_index()
+    start, stop = index.get(member_id, (0, 0))
+    # A row slice is a view of the shared snapshot, the page adds columns to what it gets
+    return predictions.iloc[start:stop].copy()
 
 ####################################################################################################
 # Standings
 ####################################################################################################
 
-@st.cache_data(ttl=300)
+# Every score shown comes from the points ledger (see Points ledger), the `standings` table isn't
+# read or written any more. Totals, positions and their movement always agree, and saving a result
+# re-scores the ledger rows of the matches it changed from what was saved, which writes the same
+# rows however many times it's repeated.
+
+# Every write that scores matches holds it, so two saves in this process (e.g. the score saves
+# worker and a bulk import) can't interleave reading the results and writing what they score
+write_lock = threading.RLock()
+
+STANDINGS_DTYPES = {
+    'member_id': 'int32',
+    'name': 'string[pyarrow]',
+    'group_home_goals': 'Int16',
+    'group_away_goals': 'Int16',
+    'group_result': 'Int16',
+    'group_perfect_prediction': 'Int16',
+    'tournament_winner': 'Int16',
+}
+
 def get_standings():
-    members_data = pd.DataFrame(execute_query(client.table("members").select("id", "name")).data)
-    standings_data = pd.DataFrame(execute_query(client.table("standings").select(
-        "member_id",
-        "group_home_goals",
-        "group_away_goals",
-        "group_result",
-        "group_perfect_prediction",
-        "tournament_winner"
-    )).data)
-    member_standings = pd.merge(members_data, standings_data, left_on='id', right_on='member_id')
-    return member_standings
-
-def update_standings(stage, home, away, home_goals, away_goals, home_penalties=None, away_penalties=None, next_game=None):
-    # Fetch data from the database
-    matches = pd.DataFrame(execute_query(client.table("matches").select("number", "home", "home_goals", "away", "away_goals", "stage", "next_game").order("number")).data)
-    predictions = pd.DataFrame(execute_query(client.table("predictions").select("member_id", "match_number", "home_team_prediction", "home_goals_prediction", "away_team_prediction", "away_goals_prediction")).data)
-
-    # Join the data
-    df = pd.merge(matches, predictions, left_on='number', right_on='match_number')
-    df = df[["member_id", "match_number", "home_goals", "away_goals", "home_goals_prediction", "away_goals_prediction", "stage", "home", "home_team_prediction", "away", "away_team_prediction"]]
-
-    # Initialize the standings DataFrame
-    standings = pd.DataFrame(columns=['member_id', 'group_home_goals', 'group_away_goals', 'group_result', 'group_perfect_prediction', 'tournament_winner', 'total'])
-
-    ### Calculate and store Group Points
-    if stage == 'Group':
-        group_matches = df[df['stage'] == 'Group']
-        for _, row in group_matches.iterrows():
-            member = row['member_id']
-            # Initialize the member's row in standings if it doesn't exist
-            if member not in standings['member_id'].values:
-                standings = standings._append({
-                    'member_id': member, 
-                    'group_home_goals': 0,
-                    'group_away_goals': 0,
-                    'group_result': 0,
-                    'group_perfect_prediction': 0,
-                }, ignore_index=True)
-            
-            # Calculate points
-            if row['home_goals'] == row['home_goals_prediction']:
-                standings.loc[standings['member_id'] == member, 'group_home_goals'] += 1
-            if row['away_goals'] == row['away_goals_prediction']:
-                standings.loc[standings['member_id'] == member, 'group_away_goals'] += 1
-            if (row['home_goals'] - row['away_goals']) * (row['home_goals_prediction'] - row['away_goals_prediction']) > 0:
-                standings.loc[standings['member_id'] == member, 'group_result'] += 1
-            if (row['home_goals'] == row['away_goals'] and row['home_goals_prediction'] == row['away_goals_prediction']):
-                standings.loc[standings['member_id'] == member, 'group_result'] += 1
-            if row['home_goals'] == row['home_goals_prediction'] and row['away_goals'] == row['away_goals_prediction']:
-                standings.loc[standings['member_id'] == member, 'group_perfect_prediction'] += 1
-        
-        standings['group_total'] = standings['group_home_goals'] + standings['group_away_goals'] + (standings['group_result'] * 3) + (standings['group_perfect_prediction'] *3)
-        update_standings_array = [
-            {
-                'member_id': row['member_id'],
-                'group_home_goals': row['group_home_goals'],
-                'group_away_goals': row['group_away_goals'],
-                'group_result': row['group_result'],
-                'group_perfect_prediction': row['group_perfect_prediction']
-            }
-            for index, row in standings.iterrows()
-        ]
-        execute_query(client.table("standings").upsert(update_standings_array))
-
-    ### Calculate and store Knockout Points
-
-    if stage != 'Group' and stage != 'Final':
-        # Update the team names for the Quarter finals
-        if home_goals > away_goals:
-            winner = home
-        if home_goals < away_goals:
-            winner = away
-        if home_goals == away_goals:
-            if home_penalties > away_penalties:
-                winner = home
-            if home_penalties < away_penalties:
-                winner = away
-    
-        # Get the match to update
-        next_match_number = next_game.split("-")[0]
-
-        # Update the next match with the winner
-        if next_game.split("-")[1] == 'home':
-            execute_query(client.table("matches").update({"home": winner}).eq("number", next_match_number))
-        if next_game.split("-")[1] == 'away':
-            execute_query(client.table("matches").update({"away": winner}).eq("number", next_match_number))
-
-    if stage == 'Final':
-        # Workout the match winner
-        final_match = df[df['stage'] == 'Finals']
-        final_match['winner'] = final_match.apply(lambda x: x['home'] if x['home_goals'] > x['away_goals'] else x['away'], axis=1)
-
-        # Get the members
-        members = pd.DataFrame(execute_query(client.table("members").select("id", "winning_team")).data)
-        update_standings_array = [
-            {
-                'member_id': row['id'],
-                'tournament_winner': 1 if row['winning_team'] == final_match['winner'].values[0] else 0
-            }
-            for index, row in members.iterrows()
-        ]
-        execute_query(client.table("standings").upsert(update_standings_array))
-
-@st.cache_data(ttl=300)
+    """
+    Returns every member's group stage and tournament winner hits with their name, added up from
+    the points ledger once per version of the tables and shared by all sessions (see Snapshots).
+    Treat it as read-only.
+    """
+    return _get_standings(_ledger_version("members"))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_standings(version):
+    members = get_table("members")
+    hits = pd.DataFrame(Scoring.ledger_hits(get_points_ledger(), members['id']), columns=Scoring.CATEGORIES)
+    standings = hits[[column for column in STANDINGS_DTYPES if column in hits]]
+    standings.insert(0, 'member_id', members['id'].to_numpy())
+    standings.insert(1, 'name', members['name'].to_numpy())
+    return standings.astype(STANDINGS_DTYPES)
+
+def recompute_group_standings():
+    """Re-scores every group match into the points ledger from scratch, e.g. after results were edited in the database directly."""
+    matches = Common.get_repository().select("matches", "number", eq={"stage": "Group"})
+    update_points_ledger([match["number"] for match in matches])
+
+####################################################################################################
+# Bulk results
+####################################################################################################
+
+RESULT_COLUMNS = ["number", "home_goals", "away_goals", "home_penalties", "away_penalties"]
+
+def _parse_result(row):
+    # Whole, non-negative numbers, or None for blanks
+    values = {}
+    for column in RESULT_COLUMNS:
+        value = row.get(column)
+        if value is None or pd.isna(value) or str(value).strip() == "":
+            values[column] = None
+            continue
+        number = pd.to_numeric(str(value).strip(), errors='coerce')
+        if pd.isna(number) or number < 0 or number != int(number):
+            raise ValueError(f"{column} must be a whole number, not '{value}'")
+        values[column] = int(number)
+    if values["number"] is None or values["home_goals"] is None or values["away_goals"] is None:
+        raise ValueError("number, home_goals and away_goals are required")
+    return values
+
+def _check_penalties(result, match):
+    has_penalties = result["home_penalties"] is not None or result["away_penalties"] is not None
+    if match["stage"] == "Group" or result["home_goals"] != result["away_goals"]:
+        if has_penalties:
+            raise ValueError("penalties are only for knockout matches that ended in a draw")
+    elif result["home_penalties"] is None or result["away_penalties"] is None or result["home_penalties"] == result["away_penalties"]:
+        raise ValueError("a drawn knockout match needs both penalty scores, and a winner")
+
+def prepare_results(results):
+    """
+    Validates a table of results (see `RESULT_COLUMNS`, penalties are optional) against the
+    fixture list and works out every `matches` row it changes, including the teams sent through
+    to their next games.
+
+    Returns the changed rows and a list of errors, nothing should be written if there are any.
+    """
+    matches = {match["number"]: match for match in Common.get_repository().select("matches", *Repository.TABLES["matches"]["columns"])}
+    errors = []
+    parsed = {}
+    for index, row in enumerate(results.to_dict('records'), start=1):
+        try:
+            result = _parse_result(row)
+            if result["number"] not in matches:
+                raise ValueError(f"there is no match {result['number']}")
+            if result["number"] in parsed:
+                raise ValueError(f"match {result['number']} appears more than once")
+            _check_penalties(result, matches[result["number"]])
+            parsed[result["number"]] = result
+        except ValueError as e:
+            errors.append(f"Row {index}: {e}")
+    if errors:
+        return [], errors
+
+    # Apply the results in match order, so winners reach later matches before those are checked
+    changed = {}
+    for number in sorted(parsed):
+        match = changed.setdefault(number, dict(matches[number]))
+        match.update(parsed[number])
+        if match["stage"] == "Group":
+            continue
+        if match["home"] is None or match["away"] is None:
+            errors.append(f"Match {number}: the teams aren't known yet")
+            continue
+        if match["next_game"]:
+            next_number, side = match["next_game"].split("-")
+            next_match = changed.setdefault(int(next_number), dict(matches[int(next_number)]))
+            next_match[side] = Scoring.match_winner(**{column: match[column] for column in ["home", "away", "home_goals", "away_goals", "home_penalties", "away_penalties"]})
+    if errors:
+        return [], errors
+    return [changed[number] for number in sorted(changed)], []
+
+def import_results(results):
+    """
+    Saves a table of results in one batched write to `matches`, sends every knockout winner
+    through to their next game, then re-scores the points ledger rows of every match it changed
+    in one go, holding `write_lock` throughout. Saving the same results again after a failure
+    puts everything right, as the rows are scored from what's saved rather than adjusted.
+
+    Returns the validation errors (see `prepare_results`) without writing anything if there are any.
+    """
+    with write_lock:
+        rows, errors = prepare_results(results)
+        if errors:
+            return errors
+
+        Common.get_repository().upsert("matches", rows)
+        Versions.bump("matches")
+
+        # The matches played and the knockout matches a winner was sent through to, the final's
+        # stage includes the tournament winner
+        update_points_ledger([row["number"] for row in rows])
+    return []
+
 def get_knockout_round_points():
-    # Prepare DataFrames
-    matches = pd.DataFrame(execute_query(client.table("matches").select("number", "home", "away", "stage").order("number")).data)
-    predictions = pd.DataFrame(execute_query(client.table("predictions").select("member_id", "match_number", "home_team_prediction", "away_team_prediction")).data)
-
-    # Join predictions with matches to get the stage information
-    predictions_with_stage = pd.merge(predictions, matches, left_on='match_number', right_on='number', how='left')
-
-    # Define Stage Points
-    stage_points = {
-        'Round of 16': 1,
-        'Quarter finals': 1,
-        'Semi finals': 1,
-        'Finals': 1
-    }
+    """
+    Returns, per member, how many of the teams in each knockout stage they predicted would get
+    there, added up from the points ledger.
+    """
+    return _get_knockout_round_points(_ledger_version("members"))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_knockout_round_points(version):
+    member_ids = get_table("members")['id']
+    stages = list(Scoring.KNOCKOUT_STAGES.values())
+    hits = pd.DataFrame(Scoring.ledger_hits(get_points_ledger(), member_ids), columns=Scoring.CATEGORIES)
+    points = hits[stages].astype('Int16')
+    points.insert(0, 'member_id', member_ids.to_numpy(dtype='int32'))
+    return points
+
+LEADERBOARD_COLUMNS = ['position', 'movement', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals', 'finals', 'total']
+
+MEDALS = {1: '🥇', 2: '🥈', 3: '🥉'}
+
+def get_leaderboard():
+    """
+    Returns the league table shown on the dashboard, best first, built once per version of the
+    tables it's made from and shared by all sessions. Treat it as read-only.
+
+    Members on the same total share a `rank`. `position` shows the rank, or a medal for the top
+    three, and `movement` the places moved with the last played match as arrows (see
+    `get_position_movement`). Alongside the `LEADERBOARD_COLUMNS` it has `member_id`, `rank` and
+    every scoring category in `Scoring.CATEGORY_POINTS`.
+    """
+    return _get_leaderboard(_ledger_version("matches", "members"))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_leaderboard(version):
+    leaderboard = get_standings().merge(get_knockout_round_points(), on='member_id', how='left')
+    leaderboard = leaderboard.fillna({category: 0 for category in Scoring.CATEGORIES})
+    leaderboard['group_goals'] = leaderboard['group_home_goals'] + leaderboard['group_away_goals']
+    leaderboard['group_perfect'] = leaderboard['group_perfect_prediction']
+    leaderboard['total'] = Scoring.score_hits(leaderboard[Scoring.CATEGORIES].to_numpy(dtype='int64')).astype('int32')
+    leaderboard = leaderboard.sort_values(['total', 'name'], ascending=[False, True], ignore_index=True)
+
+    rank = leaderboard['total'].rank(method='min', ascending=False).astype('int16')
+    movement = leaderboard['member_id'].map(get_position_movement()).fillna(0).astype('int16')
+    leaderboard['rank'] = rank
+    leaderboard['position'] = rank.map(MEDALS).fillna(rank.astype(str)).astype('string[pyarrow]')
+    leaderboard['movement'] = pd.Series(np.where(movement > 0, "▲ " + movement.astype(str), np.where(movement < 0, "▼ " + (-movement).astype(str), "")), dtype='string[pyarrow]')
+    return leaderboard[['member_id', 'rank', *LEADERBOARD_COLUMNS, *(category for category in Scoring.CATEGORIES if category not in LEADERBOARD_COLUMNS)]]
+
+####################################################################################################
+# Points ledger
+####################################################################################################
+
+# The `points_ledger` table holds the hits each member scored, per match and scoring category
+# (see `Scoring.CATEGORIES`), so totals and standings at any point of the tournament, under any
+# scoring rules, are sums over it. Points are only worked out when it's read, so changing the
+# rules doesn't need a rebuild. Knockout stage hits are credited to the match the predicted team
+# plays in that stage, the tournament winner hit to the final.
+
+LEDGER_PREDICTION_COLUMNS = ["member_id", "match_number", "home_goals_prediction", "away_goals_prediction", "home_team_prediction", "away_team_prediction"]
+
+def update_points_ledger(match_numbers=None):
+    """
+    Re-scores the points ledger rows of the `match_numbers` matches, or of every match if None.
+
+    Knockout points depend on every team in a stage, so a knockout match re-scores its whole stage
+    and the final also re-scores the tournament winner points. Holds `write_lock`.
+    """
+    with write_lock:
+        repo = Common.get_repository()
+        matches = pd.DataFrame(repo.select("matches", *Repository.TABLES["matches"]["columns"], order="number"))
+        numbers = set(matches['number']) if match_numbers is None else {int(number) for number in match_numbers}
+        stages = set(matches.loc[matches['number'].isin(numbers), 'stage']) - {'Group'}
+        numbers = sorted(numbers | set(matches.loc[matches['stage'].isin(stages), 'number']))
+        group_matches = matches.loc[(matches['stage'] == 'Group') & matches['number'].isin(numbers), ['number', 'home_goals', 'away_goals']]
+        knockout_matches = matches[matches['stage'].isin(stages)]
+
+        # A full rebuild pages through every prediction once, otherwise only the matches' predictions are read
+        if match_numbers is None:
+            chunks = stream_predictions(*LEDGER_PREDICTION_COLUMNS)
+        else:
+            chunks = (fetch_table("predictions", *LEDGER_PREDICTION_COLUMNS, eq={"match_number": number}) for number in numbers)
+
+        # Score the group matches a chunk at a time, only holding on to the knockout predictions
+        ledger, knockout_predictions = [], []
+        for predictions in chunks:
+            if predictions.empty:
+                continue
+            ledger.append(Scoring.group_ledger(pd.merge(group_matches, predictions, left_on='number', right_on='match_number')))
+            knockout_predictions.append(predictions[predictions['match_number'].isin(knockout_matches['number'])])
+        if stages and knockout_predictions:
+            ledger.append(Scoring.knockout_ledger(knockout_matches, pd.concat(knockout_predictions, ignore_index=True)))
+
+        if 'Finals' in stages:
+            final_match = knockout_matches[knockout_matches['stage'] == 'Finals'].iloc[0]
+            winner = Scoring.match_winner(*final_match[["home", "away", "home_goals", "away_goals", "home_penalties", "away_penalties"]])
+            members = fetch_table("members", "id", "winning_team")
+            ledger.append(pd.DataFrame({
+                'member_id': members.loc[members['winning_team'] == winner, 'id'].to_numpy(),
+                'match_number': final_match['number'],
+                'category': 'tournament_winner',
+                'hits': 1,
+            }))
+
+        # Rows are replaced in place rather than deleted and written again, so a reader never sees a
+        # match without its rows: hits that no longer score are set to zero first, and only then are
+        # the zero rows deleted
+        key = list(Repository.TABLES["points_ledger"]["key"])
+        if match_numbers is None:
+            existing = fetch_table("points_ledger", *key)
+        else:
+            existing = pd.concat([fetch_table("points_ledger", *key, eq={"match_number": number}) for number in numbers], ignore_index=True)
+        ledger = pd.concat(ledger, ignore_index=True)[Scoring.LEDGER_COLUMNS] if ledger else pd.DataFrame(columns=Scoring.LEDGER_COLUMNS)
+        stale = existing.merge(ledger[key], on=key, how='left', indicator=True)
+        stale = stale.loc[stale['_merge'] == 'left_only', key].assign(hits=0)
+        ledger = pd.concat([ledger, stale], ignore_index=True).astype({'member_id': 'int64', 'match_number': 'int64', 'hits': 'int64'})
+        for start in range(0, len(ledger), CHUNK_SIZE):
+            repo.upsert("points_ledger", ledger.iloc[start:start + CHUNK_SIZE].to_dict('records'))
+        for number in sorted(set(stale['match_number'].tolist())):
+            repo.delete("points_ledger", {"match_number": number, "hits": 0})
+        Versions.bump("points_ledger")
+        # So `sync_points_ledger` doesn't score them again
+        if _scored_matches is not None:
+            _scored_matches.update({number: score for number, score in _match_scores(matches).items() if number in numbers})
+
+def rebuild_points_ledger():
+    """Re-scores the whole points ledger, e.g. after results or teams were edited in the database directly."""
+    update_points_ledger()
+
+# The scoring columns of each match as this process last scored its ledger rows, so matches
+# changed elsewhere (e.g. the round of 16 teams entered in the database directly) are re-scored
+# once the `matches` version moves on, see `sync_points_ledger`
+SCORED_COLUMNS = ["stage", "home", "away", "home_goals", "away_goals", "home_penalties", "away_penalties"]
+_scored_matches = None
+_scored_version = None
+
+def _match_scores(matches):
+    scores = matches[SCORED_COLUMNS].astype(object)
+    scores = scores.where(scores.notna(), None)
+    return {int(number): tuple(score) for number, score in zip(matches['number'], scores.itertuples(index=False))}
+
+def sync_points_ledger():
+    """
+    Re-scores the ledger rows of every match whose teams or result changed since this process
+    last scored them, checked whenever the `matches` version moves on. The first check re-scores
+    the matches that should score but have no rows, e.g. every match of a database from before
+    the ledger was added.
+    """
+    global _scored_matches, _scored_version
+    if Versions.get("matches") == _scored_version or Common.get_repository().read_only:
+        return
+    with write_lock:
+        version = Versions.get("matches")
+        if version == _scored_version:
+            return
+        matches = get_table("matches")
+        scores = _match_scores(matches)
+        if _scored_matches is None:
+            # Played matches, or knockout matches whose teams are known, score
+            scored = matches['home_goals'].notna() | ((matches['stage'] != 'Group') & matches['home'].notna())
+            stale = set(matches.loc[scored, 'number'].astype(int).tolist()) - set(get_table("points_ledger")['match_number'].unique().tolist())
+        else:
+            stale = {number for number, score in scores.items() if _scored_matches.get(number) != score}
+        if stale:
+            update_points_ledger(sorted(stale))
+        _scored_matches, _scored_version = scores, version
+
+def _ledger_version(*tables):
+    # The versions of `tables` and the points ledger, once the ledger has caught up with `matches`
+    sync_points_ledger()
+    return Versions.get(*tables, "points_ledger")
+
+def get_points_ledger():
+    """
+    Returns every row of the points ledger, loaded once per version of the table and shared by
+    all sessions, after re-scoring any matches that changed since they were scored (see
+    `sync_points_ledger`). Treat it as read-only.
+    """
+    sync_points_ledger()
+    # The snapshot's columns are the ledger's, see `Scoring.LEDGER_COLUMNS`
+    return get_table("points_ledger")
+
+def get_position_history():
+    """
+    Returns every member's league position after each played match, one row per member and one
+    column per match number. Members on the same points share a position.
+
+    Points for matches still to be played (knockout teams already known) count from the latest
+    played match before them.
+    """
+    return _get_position_history(_ledger_version("matches", "members"))
+
+@Instrumentation.cached(st.cache_data(max_entries=4))
+def _get_position_history(version):
+    matches = get_table("matches")
+    played = matches.loc[matches['home_goals'].notna(), 'number'].to_numpy(dtype='int64')
+    member_ids = get_table("members")['id'].rename('member_id')
+    if not len(played):
+        return pd.DataFrame(index=member_ids)
+
+    ledger = get_points_ledger()
+    step = played[np.clip(np.searchsorted(played, ledger['match_number'].to_numpy(), side='right') - 1, 0, None)]
+    points = Scoring.ledger_points(ledger).groupby([ledger['member_id'].to_numpy(), step]).sum().unstack(fill_value=0)
+    points = points.reindex(index=member_ids, columns=played, fill_value=0)
+    return points.cumsum(axis=1).rank(method='min', ascending=False).astype('int64')
+
+def get_position_movement():
+    """Returns how many places each member went up (or down, if negative) with the last played match."""
+    history = get_position_history()
+    if history.shape[1] < 2:
+        return pd.Series(0, index=history.index, name='movement')
+    return (history.iloc[:, -2] - history.iloc[:, -1]).rename('movement')
+
+####################################################################################################
+# Alternative rules
+####################################################################################################
+
+def rescore(rules):
+    """
+    Re-scores the whole league under each of the sets of scoring `rules`, a dict mapping a name to
+    points per hit for any of the scoring categories (see `Scoring.compile_rules`), in one batch
+    from the hits in the points ledger.
+
+    Returns each member's `member_id` and `name`, then a total and a rank (members on the same
+    total share it) for every set of rules, as `<name>_total` and `<name>_rank`.
+    """
+    members = get_table("members")
+    totals = Scoring.score_hits(Scoring.ledger_hits(get_points_ledger(), members['id']), Scoring.compile_rules(*rules.values()))
+    totals = pd.DataFrame(totals, columns=list(rules))
+    ranks = totals.rank(method='min', ascending=False).astype('int64')
+    return pd.concat([
+        pd.DataFrame({'member_id': members['id'].to_numpy(), 'name': members['name'].to_numpy()}),
+        totals.add_suffix('_total'),
+        ranks.add_suffix('_rank'),
+    ], axis=1)
+
+####################################################################################################
+# Consensus
+####################################################################################################
+
+# What everyone predicted for each match, aggregated in one pass over the predictions whenever
+# they change, so showing any match's consensus is a lookup rather than a scan. Who scored with
+# each match comes from the points ledger, counted separately whenever results change, so a
+# result doesn't throw the aggregates away.
+
+OUTCOMES = {1: 'home', 0: 'draw', -1: 'away'}
+
+def get_consensus():
+    """
+    Returns the consensus of every match with predictions, a dict mapping the match number to
+    what `get_match_consensus` returns without its `hits`, built once per version of the
+    `predictions` table and shared by all sessions. Treat it as read-only.
+    """
+    return _get_consensus(Versions.get("predictions"))
+
+def get_match_hits():
+    """
+    Returns how many members scored in each scoring category with each match so far, a dict
+    mapping the match number to a dict of counts per category, built once per version of the
+    `points_ledger` table and shared by all sessions. Treat it as read-only.
+    """
+    return _get_match_hits(_ledger_version())
+
+def get_match_consensus(match_number):
+    """
+    Returns what everyone predicted for a match as a dict, or None if nobody predicted it:
+
+    - `predictions`: how many members predicted the score
+    - `scorelines`: the `members` predicting each score and their `share`, most picked first
+    - `outcomes`: the share of members predicting a `home` win, a `draw` and an `away` win
+    - `teams`: for knockout matches, the `members` picking each team to play in the match's stage
+      and their `share` of everyone with a pick for it, most picked first (None for group matches)
+    - `hits`: how many members scored in each scoring category with the match so far
+    """
+    consensus = get_consensus().get(match_number)
+    return None if consensus is None else {**consensus, 'hits': get_match_hits().get(match_number, {})}
+
+def _whole_members(chunks):
+    # Holds back the last member of each chunk until the next one, so no member's predictions
+    # are split between chunks (they come ordered by member)
+    carry = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        last = chunk['member_id'] == chunk['member_id'].iloc[-1]
+        carry = chunk[last]
+        if not last.all():
+            yield chunk[~last]
+    if carry is not None:
+        yield carry
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_consensus(version):
+    # Only the stages are used, and those are fixed by the fixture list
+    matches = get_table("matches")
+    stage_of = pd.Series(matches['stage'].to_numpy(dtype=object), index=matches['number'].to_numpy())
+
+    # Count the scorelines and knockout teams a chunk at a time, a team counts once per member and stage
+    predicted, scorelines, teams, pickers = [], [], [], []
+    for predictions in _whole_members(stream_predictions(*LEDGER_PREDICTION_COLUMNS)):
+        scored = predictions.dropna(subset=['home_goals_prediction', 'away_goals_prediction'])
+        predicted.append(scored.groupby('match_number').size())
+        scorelines.append(scored.groupby(['match_number', 'home_goals_prediction', 'away_goals_prediction']).size())
+
+        knockout = predictions.assign(stage=predictions['match_number'].map(stage_of))
+        knockout = knockout[knockout['stage'].isin(list(Scoring.KNOCKOUT_STAGES))]
+        picks = pd.concat([
+            knockout[['member_id', 'stage', f'{side}_team_prediction']].set_axis(['member_id', 'stage', 'team'], axis=1)
+            for side in ['home', 'away']
+        ]).dropna().drop_duplicates()
+        teams.append(picks.groupby(['stage', 'team']).size())
+        pickers.append(picks.drop_duplicates(['member_id', 'stage']).groupby('stage').size())
+    if not predicted:
+        return {}
+
+    def total(counts):
+        counts = [count for count in counts if len(count)]
+        return pd.concat(counts).groupby(level=list(range(counts[0].index.nlevels))).sum() if counts else pd.Series(dtype='int64')
+
+    predicted, pickers = total(predicted), total(pickers)
+    scorelines = total(scorelines).rename('members').reset_index()
+    scorelines = scorelines.astype({'home_goals_prediction': 'int64', 'away_goals_prediction': 'int64'})
+    scorelines['outcome'] = np.sign(scorelines['home_goals_prediction'] - scorelines['away_goals_prediction']).map(OUTCOMES)
+
+    # The most picked teams of each knockout stage, shared by the stage's matches
+    stage_teams = {}
+    for (stage, team), members in total(teams).sort_values(ascending=False, kind='stable').items():
+        stage_teams.setdefault(stage, []).append((team, members, members / pickers[stage]))
+    stage_teams = {stage: pd.DataFrame(picked, columns=['team', 'members', 'share']) for stage, picked in stage_teams.items()}
+
+    consensus = {}
+    for number, counts in scorelines.groupby('match_number'):
+        counts = counts.sort_values(['members', 'home_goals_prediction', 'away_goals_prediction'], ascending=[False, True, True], ignore_index=True)
+        members = predicted[number]
+        outcomes = counts.groupby('outcome')['members'].sum().reindex(list(OUTCOMES.values()), fill_value=0) / members
+        consensus[int(number)] = {
+            'predictions': int(members),
+            'scorelines': counts[['home_goals_prediction', 'away_goals_prediction', 'members']].assign(share=counts['members'] / members),
+            'outcomes': outcomes.to_dict(),
+            'teams': stage_teams.get(stage_of[number]) if stage_of[number] != 'Group' else None,
+        }
+    return consensus
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_match_hits(version):
+    ledger = get_points_ledger()
+    hits = ledger[ledger['hits'] > 0].groupby(['match_number', 'category'], observed=True).size()
+    return {int(number): counts.droplevel(0).to_dict() for number, counts in hits.groupby(level=0)}
+
+####################################################################################################
+# Simulation
+####################################################################################################
+
+def get_simulation(simulations=None):
+    """
+    Returns each member's chances of winning and of finishing in each position, from
+    `simulations` simulated endings of the tournament (`Simulation.SIMULATIONS` if None, see
+    `Simulation.simulate`), with their `name`.
+
+    Simulating is expensive, so it's only done again once a result, member or prediction is saved.
+    """
+    return _get_simulation(simulations, Versions.get("matches", "members", "predictions"))
+
+@Instrumentation.cached(st.cache_data(max_entries=4))
+def _get_simulation(simulations, version):
+    # Only the dashboard simulates, and only while there are matches left to play
+    import Simulation
 
-    points_per_member = []
-
-    for stage, points_per_team in stage_points.items():
-        actual_teams_stage = set(matches[matches['stage'] == stage]['home'].tolist() + matches[matches['stage'] == stage]['away'].tolist())
-        stage_predictions = predictions_with_stage[predictions_with_stage['stage'] == stage]
-        
-        for member_id, group in stage_predictions.groupby('member_id'):
-            predicted_teams = set(group['home_team_prediction'].tolist() + group['away_team_prediction'].tolist())
-            correct_predictions = len(predicted_teams & actual_teams_stage)
-            points_per_member.append({'member_id': member_id, 'stage': stage, 'points': correct_predictions})
-    
-    # Convert to DataFrame
-    df_points = pd.DataFrame(points_per_member)
-
-    # Pivot Table to show points per stage for each member
-    pivot_df = df_points.pivot_table(index='member_id', columns='stage', values='points', fill_value=0).reset_index()
-
-    # Adjust namings and data types
-    pivot_df['round_of_16'] = pivot_df['Round of 16'].astype('Int64')
-    pivot_df['quarter_finals'] = pivot_df['Quarter finals'].astype('Int64')
-    pivot_df['semi_finals'] = pivot_df['Semi finals'].astype('Int64')
-    pivot_df['finals'] = pivot_df['Finals'].astype('Int64')
-
-    return pivot_df
-
-@st.cache_data(ttl=300)
-def get_standings_totals(member_standings):
-    # Calculate group points
-    member_standings['group_goals'] = member_standings['group_home_goals'] + member_standings['group_away_goals']
-    member_standings['total'] = member_standings['group_goals'] + (member_standings['group_result'] * 3) + (member_standings['group_perfect_prediction'] * 3)
-    
-    # Calculate total with knockout points
-    member_standings['tournament_winner'] = member_standings['tournament_winner'].fillna(0)
-    member_standings['total'] = member_standings['total'] + (member_standings['round_of_16'] * 3) + (member_standings['quarter_finals'] * 4) + (member_standings['semi_finals'] * 6) + (member_standings['finals'] * 8) + (member_standings['tournament_winner'] * 20)
-
-    member_standings = member_standings.sort_values(by='total', ascending=False).reset_index(drop=True)
-    member_standings.insert(0, 'position', range(1, 1 + len(member_standings)))
-    member_standings['group_perfect'] = member_standings['group_perfect_prediction']
-    member_standings = member_standings[['position', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals', 'finals', 'total']]
-
-    return member_standings
\ No newline at end of file
+    matches = get_table("matches")
+    members = get_table("members")[['id', 'name', 'winning_team']]
+    predictions = fetch_table("predictions", *LEDGER_PREDICTION_COLUMNS)
+    simulation = Simulation.simulate(matches, members, predictions, simulations=simulations or Simulation.SIMULATIONS)
+    return simulation.merge(members[['id', 'name']], left_on='member_id', right_on='id').drop(columns='id')
@@ -0,0 +1,233 @@
+"""
+Bulk loads members' predictions from a CSV or Excel (.xlsx) export, e.g. of a sign-up form.
+
+The file has a header row and one row per member per match, with the `COLUMNS` and optionally the
+`MEMBER_COLUMNS`. It's read, checked against the fixture list and saved a chunk of rows at a time,
+so memory use doesn't grow with the size of the file:
+
+- group match teams can be left blank, otherwise they must be the fixture's teams, knockout match
+  teams must be teams in the tournament, and goals whole numbers
+- bad rows are skipped and reported, with their row number in the file
+- a later row for the same member and match replaces an earlier one
+- members who aren't in the league yet are added from the `name` and winning picks on their
+  rows; existing members are left as they are
+
+Once everything is saved the points ledger is re-scored, if any results are in.
+That's a full re-score of the league rather than of the rows loaded, so unlike the load its time
+and memory grow with the number of members (see `benchmarks/ingestion.py`).
+
+Usage: python Ingestion.py predictions.csv [--chunk-size 5000]
+
+loads into the repository the app is configured to use (see `Common.get_repository`).
+"""
+import time
+import argparse
+import pandas as pd
+import Common
+import Database
+import Versions
+
+COLUMNS = ["member_id", "match_number", "home_team_prediction", "home_goals_prediction", "away_team_prediction", "away_goals_prediction"]
+MEMBER_COLUMNS = ["name", "winning_country", "winning_team"]
+
+# Rows read, checked and upserted at a time
+CHUNK_SIZE = 5_000
+
+# Errors kept for the report, the rest are only counted
+MAX_ERRORS = 1_000
+
+####################################################################################################
+# Reading
+####################################################################################################
+
+def read_rows(path, chunk_size=CHUNK_SIZE):
+    """Yields the rows of a CSV or Excel file as DataFrames of strings, `chunk_size` rows at a time."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        yield from _read_excel(path, chunk_size)
+    else:
+        yield from pd.read_csv(path, dtype=str, keep_default_na=False, skipinitialspace=True, chunksize=chunk_size)
+
+def _read_excel(path, chunk_size):
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise ImportError("Reading Excel files needs openpyxl, install it with `pip install openpyxl`") from e
+
+    # Read-only workbooks stream their rows rather than loading the whole sheet
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = ["" if cell is None else str(cell).strip() for cell in next(rows, ())]
+        chunk = []
+        for row in rows:
+            chunk.append(["" if cell is None else str(cell) for cell in row[:len(header)]])
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+####################################################################################################
+# Checking
+####################################################################################################
+
+def get_fixtures():
+    """Returns the fixture list indexed by match number, and the set of teams in the tournament."""
+    matches = pd.DataFrame(Common.get_repository().select("matches", "number", "stage", "home", "away"))
+    group = matches[matches['stage'] == 'Group']
+    return matches.set_index('number'), set(group['home']) | set(group['away'])
+
+def _whole_numbers(values):
+    numbers = pd.to_numeric(values, errors='coerce')
+    return numbers, numbers.notna() & (numbers >= 0) & (numbers == numbers.round())
+
+def prepare_predictions(rows, fixtures, teams, first_row=2):
+    """
+    Checks a DataFrame of `COLUMNS` strings (see `read_rows`) against the fixture list.
+
+    Returns the valid rows as `predictions` rows, with their member columns and row numbers in the
+    file (`first_row` is the number of the first one), and the errors for the rest.
+    """
+    missing = [column for column in COLUMNS if column not in rows]
+    if missing:
+        raise ValueError(f"The file has no {', '.join(missing)} column{'' if len(missing) == 1 else 's'}")
+    rows = rows.reindex(columns=COLUMNS + MEMBER_COLUMNS, fill_value="").fillna("")
+    rows = rows.apply(lambda column: column.str.strip()).reset_index(drop=True)
+
+    member_id, valid_member = _whole_numbers(rows['member_id'])
+    match_number, _ = _whole_numbers(rows['match_number'])
+    fixture = fixtures.reindex(match_number)
+    is_group = (fixture['stage'] == 'Group').to_numpy()
+
+    # The first problem with each row
+    problems = pd.Series("", index=rows.index)
+    def check(ok, problem):
+        problems.mask((problems == "") & ~ok, problem, inplace=True)
+
+    check(valid_member & (member_id > 0), "member_id must be a whole number above 0")
+    check(pd.Series(fixture['stage'].notna().to_numpy()), "match_number isn't a match in the fixture list")
+    predicted = {}
+    for side in ["home", "away"]:
+        goals, valid_goals = _whole_numbers(rows[f'{side}_goals_prediction'])
+        check(valid_goals, f"{side}_goals_prediction must be a whole number")
+        predicted[f'{side}_goals_prediction'] = goals
+
+        # Group match teams are the fixture's, knockout teams any team in the tournament
+        team, fixture_team = rows[f'{side}_team_prediction'], pd.Series(fixture[side].to_numpy(), index=rows.index)
+        team = team.mask(is_group & (team == ""), fixture_team)
+        check(~is_group | (team == fixture_team), f"{side}_team_prediction must be " + fixture_team.fillna("") + " for this group match")
+        check(is_group | team.isin(teams), f"{side}_team_prediction must be a team in the tournament")
+        predicted[f'{side}_team_prediction'] = team
+    for column in ["winning_country", "winning_team"]:
+        check((rows[column] == "") | rows[column].isin(teams), f"{column} must be a team in the tournament")
+
+    row_numbers = pd.Series(range(first_row, first_row + len(rows)))
+    errors = [f"Row {row}: {problem}" for row, problem in zip(row_numbers[problems != ""], problems[problems != ""])]
+    valid = problems == ""
+    predictions = pd.DataFrame({
+        'row': row_numbers,
+        'member_id': member_id,
+        'match_number': match_number,
+        **predicted,
+        **{column: rows[column].mask(rows[column] == "") for column in MEMBER_COLUMNS},
+    })[valid]
+    predictions = predictions.astype({column: 'int64' for column in ['member_id', 'match_number', 'home_goals_prediction', 'away_goals_prediction']})
+    return predictions, errors
+
+####################################################################################################
+# Loading
+####################################################################################################
+
+def ingest_predictions(chunks, chunk_size=CHUNK_SIZE, rescore_standings=True):
+    """
+    Saves predictions from `chunks` of rows (see `read_rows`), upserting at most `chunk_size` rows
+    per request, then re-scores the points ledger once unless `rescore_standings` is false.
+
+    Returns a report of the rows read, saved, rejected and replaced by later rows, the members
+    added, the first `MAX_ERRORS` errors, how long the load took and, separately as it isn't
+    bounded by the chunk size, how long the re-score took.
+    """
+    started = time.perf_counter()
+    repo = Common.get_repository()
+    fixtures, teams = get_fixtures()
+    members = set(Database.fetch_table("members", "id")['id'].tolist())
+    report = {"rows": 0, "saved": 0, "rejected": 0, "replaced": 0, "members_added": 0, "errors": []}
+    # The matches saved so far per member, as bits, to count rows replaced by a later chunk
+    seen = {}
+
+    def reject(errors):
+        report["rejected"] += len(errors)
+        report["errors"] += errors[:MAX_ERRORS - len(report["errors"])]
+
+    for rows in chunks:
+        predictions, errors = prepare_predictions(rows, fixtures, teams, first_row=report["rows"] + 2)
+        report["rows"] += len(rows)
+        reject(errors)
+
+        # New members need a name
+        new = predictions[~predictions['member_id'].isin(members)]
+        new_members = new.groupby('member_id')[MEMBER_COLUMNS].first()
+        nameless = new['member_id'].isin(new_members.index[new_members['name'].isna()])
+        reject([f"Row {row}: member {member} isn't in the league yet and has no name" for row, member in new.loc[nameless, ['row', 'member_id']].itertuples(index=False)])
+        predictions = predictions.drop(new.index[nameless])
+        new_members = new_members.dropna(subset=['name'])
+        if len(new_members):
+            new_members = new_members.reset_index().rename(columns={'member_id': 'id'})
+            repo.upsert("members", new_members.astype(object).where(new_members.notna(), None).to_dict('records'))
+            members.update(new_members['id'].tolist())
+            report["members_added"] += len(new_members)
+
+        # The last row for a member and match wins, as it would if they were saved one by one
+        predictions = predictions.drop_duplicates(['member_id', 'match_number'], keep='last')
+        report["replaced"] += int(len(rows) - len(errors) - nameless.sum() - len(predictions))
+        for member, numbers in predictions.groupby('member_id')['match_number']:
+            bits = sum(1 << number for number in numbers.tolist())
+            saved_before = (seen.get(member, 0) & bits).bit_count()
+            report["replaced"] += saved_before
+            report["saved"] -= saved_before
+            seen[member] = seen.get(member, 0) | bits
+
+        predictions = predictions[Database.LEDGER_PREDICTION_COLUMNS]
+        for start in range(0, len(predictions), chunk_size):
+            repo.upsert("predictions", predictions.iloc[start:start + chunk_size].to_dict('records'))
+        report["saved"] += len(predictions)
+
+    Versions.bump("members", "predictions")
+    report["seconds"] = time.perf_counter() - started
+    if rescore_standings:
+        started = time.perf_counter()
+        rescore()
+        report["rescore_seconds"] = time.perf_counter() - started
+    return report
+
+def rescore():
+    """
+    Re-scores the points ledger rows of every match with a result or known teams, in one go. This
+    reads every member's predictions, so its memory grows with the league.
+    """
+    matches = pd.DataFrame(Common.get_repository().select("matches", "number", "stage", "home", "home_goals"))
+    scored = matches['home_goals'].notna() | ((matches['stage'] != 'Group') & matches['home'].notna())
+    if scored.any():
+        Database.update_points_ledger(matches.loc[scored, 'number'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="CSV or .xlsx file of predictions")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    report = ingest_predictions(read_rows(args.path, args.chunk_size), args.chunk_size)
+    for error in report["errors"]:
+        print(error)
+    if report["rejected"] > len(report["errors"]):
+        print(f"... and {report['rejected'] - len(report['errors']):,} more errors")
+    print(f"{report['rows']:,} rows read: {report['saved']:,} predictions saved, {report['rejected']:,} rejected, "
+          f"{report['replaced']:,} replaced by later rows, {report['members_added']:,} members added")
+    print(f"Loaded in {report['seconds']:.1f} s, {report['rows'] / report['seconds']:,.0f} rows/s")
+    if "rescore_seconds" in report:
+        print(f"Re-scored the whole league in {report['rescore_seconds']:.1f} s, this step isn't bounded by the chunk size")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import json
+import time
+import threading
+import functools
+import contextlib
+from collections import deque
+import Repository
+
+# Lightweight tracing of where a page view spends its time: every repository query, every cached
+# read (and whether it was a cache hit) and every page section. Traces are kept in memory for the
+# admin diagnostics page, only the most recent `MAX_TRACES` of them.
+
+MAX_TRACES = 10_000
+
+# Rows serialized to estimate a query's payload size, spread evenly over what it returned
+PAYLOAD_SAMPLE_ROWS = 20
+
+_traces = deque(maxlen=MAX_TRACES)
+_lock = threading.Lock()
+_local = threading.local()
+
+def record(kind, name, seconds, rows=None, payload_bytes=None, cache=None, table=None):
+    """Keeps a trace of one call, tagged with the page section it was made in."""
+    trace = {
+        "time": time.time(),
+        "kind": kind,
+        "name": name,
+        "table": table,
+        "section": current_section(),
+        "seconds": seconds,
+        "rows": rows,
+        "payload_bytes": payload_bytes,
+        "cache": cache,
+    }
+    with _lock:
+        _traces.append(trace)
+
+def get_traces():
+    """Returns a copy of the traces kept so far, oldest first."""
+    with _lock:
+        return list(_traces)
+
+def clear():
+    with _lock:
+        _traces.clear()
+
+def _length(result):
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def _payload_bytes(rows):
+    # Estimated from a sample of the rows, serializing a whole page would cost about as much as fetching it
+    if rows is None:
+        return None
+    if not isinstance(rows, list) or len(rows) <= PAYLOAD_SAMPLE_ROWS:
+        return len(json.dumps(rows, separators=(",", ":"), default=str))
+    sample = rows[::len(rows) // PAYLOAD_SAMPLE_ROWS][:PAYLOAD_SAMPLE_ROWS]
+    return round(len(json.dumps(sample, separators=(",", ":"), default=str)) * len(rows) / len(sample))
+
+####################################################################################################
+# Page sections
+####################################################################################################
+
+def current_section():
+    """The innermost page section the current script run is in, e.g. "Dashboard / Standings"."""
+    sections = getattr(_local, "sections", None)
+    return " / ".join(sections) if sections else None
+
+@contextlib.contextmanager
+def section(name):
+    """
+    Times a block of a page. Sections nest, and everything recorded inside is tagged with them.
+    Streamlit runs each session's script in its own thread, so sessions don't mix.
+    """
+    sections = _local.__dict__.setdefault("sections", [])
+    sections.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        record("section", current_section(), seconds)
+        sections.pop()
+
+####################################################################################################
+# Cached reads
+####################################################################################################
+
+def cached(cache):
+    """
+    Applies a Streamlit cache decorator, recording each call as a cache hit or miss, e.g.
+    `@Instrumentation.cached(st.cache_data(max_entries=4))`.
+    """
+    def decorator(function):
+        state = threading.local()
+
+        @cache
+        @functools.wraps(function)
+        def compute(*args, **kwargs):
+            state.missed = True
+            return function(*args, **kwargs)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            state.missed = False
+            start = time.perf_counter()
+            result = compute(*args, **kwargs)
+            record("cache", function.__name__, time.perf_counter() - start, rows=_length(result), cache="miss" if state.missed else "hit")
+            return result
+
+        wrapper.clear = compute.clear
+        return wrapper
+    return decorator
+
+####################################################################################################
+# Repository queries
+####################################################################################################
+
+class InstrumentedRepository(Repository.Repository):
+    """
+    Forwards to another repository, recording the latency, rows returned and estimated JSON
+    payload size of each query made through it.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def __getattr__(self, name):
+        # Anything else, e.g. `SQLiteRepository.replicate`, goes straight through
+        return getattr(self.repo, name)
+
+    @property
+    def read_only(self):
+        return self.repo.read_only
+
+    def _call(self, operation, table, *args, **kwargs):
+        start = time.perf_counter()
+        rows = getattr(self.repo, operation)(table, *args, **kwargs)
+        seconds = time.perf_counter() - start
+        record("query", operation, seconds, rows=_length(rows), payload_bytes=_payload_bytes(rows), table=table)
+        return rows
+
+    def select(self, table, *columns, **kwargs):
+        return self._call("select", table, *columns, **kwargs)
+
+    def select_page(self, table, *columns, **kwargs):
+        return self._call("select_page", table, *columns, **kwargs)
+
+    def update(self, table, values, eq):
+        return self._call("update", table, values, eq)
+
+    def upsert(self, table, rows):
+        return self._call("upsert", table, rows)
+
+    def delete(self, table, eq):
+        return self._call("delete", table, eq)
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+import pandas as pd
+import Database
+
+# Write-behind for score saves. The admin page queues each result in a local SQLite file and
+# returns straight away, a background worker saves them. Editing a match that's still queued
+# replaces the queued result, and the worker waits for saves to settle for a few seconds, then
+# saves everything queued in one `Database.import_results` batch, so the points ledger is only
+# updated once. Saves that fail are retried with a growing delay, and anything queued survives a
+# restart of the server. A retry puts everything right, as `import_results` scores the ledger from
+# what's saved, and it holds `Database.write_lock` so a bulk import can't interleave with it.
+
+logger = logging.getLogger(__name__)
+
+PATH = os.environ.get("EURO_PREDICTIONS_JOBS_PATH", "jobs.sqlite")
+
+# How long the worker waits after the latest save before processing the queue, and at most
+# after the oldest one
+SETTLE_SECONDS = 3
+MAX_WAIT_SECONDS = 30
+
+# Failed saves are retried after RETRY_SECONDS, then twice as long each time, up to MAX_ATTEMPTS
+RETRY_SECONDS = 5
+MAX_ATTEMPTS = 5
+
+class JobQueue:
+    """A durable queue of results to save, one row per save in the `jobs` table of a SQLite file."""
+
+    def __init__(self, path=PATH):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    match_number INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    queued_at REAL NOT NULL,
+                    run_after REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after)")
+            # Saves the server stopped in the middle of are done again, saving a result twice is harmless
+            self.db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+
+    def enqueue(self, result):
+        """
+        Queues a result (a dict of `Database.RESULT_COLUMNS`) and returns the job's id. A result
+        still queued for the same match is replaced by it.
+        """
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE jobs SET status = 'replaced', updated_at = ? WHERE match_number = ? AND status = 'queued'",
+                (now, result["number"]),
+            )
+            return self.db.execute(
+                "INSERT INTO jobs (match_number, result, queued_at, run_after, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (result["number"], json.dumps(result), now, now, now),
+            ).lastrowid
+
+    def claim(self, now=None, wait=True):
+        """
+        Marks every queued job that's due as running and returns them. Unless `wait` is false,
+        returns nothing until the queue has settled (see `SETTLE_SECONDS`).
+        """
+        now = time.time() if now is None else now
+        with self.lock, self.db:
+            newest, oldest = self.db.execute(
+                "SELECT MAX(queued_at), MIN(queued_at) FROM jobs WHERE status = 'queued' AND run_after <= ?", (now,)
+            ).fetchone()
+            if newest is None or wait and (now - newest < SETTLE_SECONDS and now - oldest < MAX_WAIT_SECONDS):
+                return []
+            jobs = [dict(row) for row in self.db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY id", (now,)
+            )]
+            self.db.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(now, job["id"]) for job in jobs],
+            )
+        for job in jobs:
+            job["result"] = json.loads(job["result"])
+            job["attempts"] += 1
+        return jobs
+
+    def finish(self, jobs, error=None, retry=False):
+        """Marks `jobs` done, or failed with `error`, queueing them again if `retry`."""
+        now = time.time()
+        with self.lock, self.db:
+            for job in jobs:
+                if error is None:
+                    self.db.execute("UPDATE jobs SET status = 'done', error = NULL, updated_at = ? WHERE id = ?", (now, job["id"]))
+                elif retry and job["attempts"] < MAX_ATTEMPTS:
+                    run_after = now + RETRY_SECONDS * 2 ** (job["attempts"] - 1)
+                    self.db.execute(
+                        "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, updated_at = ? WHERE id = ?",
+                        (error, run_after, now, job["id"]),
+                    )
+                else:
+                    self.db.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?", (error, now, job["id"]))
+
+    def recent(self, limit=20):
+        """Returns the latest `limit` jobs, newest first, as a DataFrame."""
+        with self.lock:
+            rows = [dict(row) for row in self.db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))]
+        jobs = pd.DataFrame(rows, columns=["id", "match_number", "result", "status", "attempts", "error", "queued_at", "run_after", "updated_at"])
+        for column in ["queued_at", "run_after", "updated_at"]:
+            jobs[column] = pd.to_datetime(jobs[column], unit="s")
+        return jobs
+
+    def pending(self):
+        """How many jobs are queued or running."""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+class Worker:
+    """Saves the queued results on a background thread, checking the queue every `interval` seconds."""
+
+    def __init__(self, queue, interval=1):
+        self.queue = queue
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="score-saves", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.process(self.queue.claim())
+            except Exception:
+                logger.exception("Couldn't process the score saves")
+
+    def process(self, jobs):
+        """Saves the results of `jobs` in one batch, falling back to one at a time to find bad ones."""
+        if not jobs:
+            return
+        try:
+            errors = Database.import_results(pd.DataFrame([job["result"] for job in jobs]))
+        except Exception as e:
+            # Most likely the database couldn't be reached, try again later
+            logger.warning("Saving %d results failed: %s", len(jobs), e)
+            self.queue.finish(jobs, error=str(e), retry=True)
+            return
+        if not errors:
+            self.queue.finish(jobs)
+        elif len(jobs) == 1:
+            # The result isn't valid any more, e.g. a knockout match whose teams changed
+            self.queue.finish(jobs, error="; ".join(errors))
+        else:
+            for job in jobs:
+                self.process([job])
+
+_queue = None
+_worker = None
+_lock = threading.Lock()
+
+def start(path=PATH):
+    """Opens the process-wide queue at `path` and starts its worker, once. Returns the queue."""
+    global _queue, _worker
+    with _lock:
+        if _queue is None:
+            _queue = JobQueue(path)
+            _worker = Worker(_queue)
+            _worker.start()
+        return _queue
+
+def flush():
+    """Saves everything that's due in the queue now, on the calling thread, without waiting for it to settle."""
+    queue = start()
+    _worker.process(queue.claim(wait=False))
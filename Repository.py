@@ -0,0 +1,406 @@
+import abc
+import sqlite3
+import threading
+from datetime import date, time
+
+####################################################################################################
+# Schema
+####################################################################################################
+
+# The tables the app reads and writes, with their key columns and (SQLite) column types
+TABLES = {
+    "matches": {
+        "key": ("number",),
+        "columns": {
+            "number": "INTEGER",
+            "date": "TEXT",
+            "time": "TEXT",
+            "stage": "TEXT",
+            "group": "TEXT",
+            "home": "TEXT",
+            "away": "TEXT",
+            "home_goals": "INTEGER",
+            "away_goals": "INTEGER",
+            "home_penalties": "INTEGER",
+            "away_penalties": "INTEGER",
+            "stadium": "TEXT",
+            "next_game": "TEXT",
+        },
+    },
+    "members": {
+        "key": ("id",),
+        "columns": {
+            "id": "INTEGER",
+            "name": "TEXT",
+            "winning_country": "TEXT",
+            "winning_team": "TEXT",
+        },
+    },
+    "predictions": {
+        "key": ("member_id", "match_number"),
+        "columns": {
+            "member_id": "INTEGER",
+            "match_number": "INTEGER",
+            "home_team_prediction": "TEXT",
+            "home_goals_prediction": "INTEGER",
+            "away_team_prediction": "TEXT",
+            "away_goals_prediction": "INTEGER",
+        },
+        # Scoring a single match reads its predictions across every member
+        "indexes": [("match_number",)],
+    },
+    # No longer read or written, scores come from the points ledger. Kept so existing databases
+    # and snapshots still line up
+    "standings": {
+        "key": ("member_id",),
+        "columns": {
+            "member_id": "INTEGER",
+            "group_home_goals": "INTEGER DEFAULT 0",
+            "group_away_goals": "INTEGER DEFAULT 0",
+            "group_result": "INTEGER DEFAULT 0",
+            "group_perfect_prediction": "INTEGER DEFAULT 0",
+            "tournament_winner": "INTEGER DEFAULT 0",
+        },
+    },
+    # Hits per member, match and scoring category, see `Scoring.CATEGORIES`
+    "points_ledger": {
+        "key": ("member_id", "match_number", "category"),
+        "columns": {
+            "member_id": "INTEGER",
+            "match_number": "INTEGER",
+            "category": "TEXT",
+            "hits": "INTEGER",
+        },
+        "indexes": [("match_number",)],
+    },
+}
+
+####################################################################################################
+# Repositories
+####################################################################################################
+
+class ReadOnlyError(Exception):
+    """Raised when writing to a read-only repository, e.g. a `ParquetRepository`."""
+
+class Repository(abc.ABC):
+    """
+    Data access for the `matches`, `members`, `predictions`, `standings` and `points_ledger` tables.
+
+    Rows go in and come out as lists of dicts, the same shape the Supabase client returns. A
+    backend implements the abstract methods, it can't be created until it has all of them.
+    """
+
+    # Whether writes raise `ReadOnlyError`
+    read_only = False
+
+    @abc.abstractmethod
+    def select(self, table, *columns, eq=None, order=None):
+        """
+        Returns `columns` of every row in `table` matching all of the `eq` column/value pairs,
+        sorted by the `order` column if given.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update(self, table, values, eq):
+        """Sets `values` on every row in `table` matching all of the `eq` column/value pairs."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def upsert(self, table, rows):
+        """Inserts `rows` into `table`, updating the given columns of rows whose key already exists."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, table, eq):
+        """Deletes every row in `table` matching all of the `eq` column/value pairs."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def select_page(self, table, *columns, after=None, eq=None, limit=1000):
+        """
+        Returns up to `limit` rows of `table` ordered by its key columns, starting after the row
+        whose key is `after` (from the first row if None).
+        """
+        raise NotImplementedError
+
+    def stream(self, table, *columns, eq=None, chunk_size=10_000):
+        """
+        Yields every row of `table` in chunks of at most `chunk_size` rows, using keyset pagination
+        on the table's key. The key columns are always included so the next page can be found.
+
+        Paging stops at the first empty page rather than the first short one, so no rows are lost
+        when the server caps the page at fewer rows than asked for.
+        """
+        key = TABLES[table]["key"]
+        columns = [*columns, *(column for column in key if column not in columns)]
+        after = None
+        while True:
+            rows = self.select_page(table, *columns, after=after, eq=eq, limit=chunk_size)
+            if not rows:
+                return
+            yield rows
+            after = tuple(rows[-1][column] for column in key)
+
+    def _value(self, value):
+        # Match what the Supabase client sends over the wire
+        if isinstance(value, (date, time)):
+            return value.isoformat()
+        if hasattr(value, "item"):
+            # NumPy scalars
+            return value.item()
+        return value
+
+    def _check(self, table, columns):
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}'")
+        unknown = [column for column in columns if column not in TABLES[table]["columns"]]
+        if unknown:
+            raise ValueError(f"Unknown columns for '{table}': {', '.join(unknown)}")
+
+class SupabaseRepository(Repository):
+    """
+    Reads and writes the hosted Supabase database through an `st.connection`.
+
+    Queries are executed directly rather than through `st_supabase_connection.execute_query`,
+    which caches every response until the server restarts. Caching is left to `Database`.
+
+    `connect` returns the connection, it's only called when the first query is made.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect()
+            return self._connection
+
+    def select(self, table, *columns, eq=None, order=None):
+        # PostgREST caps every response (1000 rows by default), so page through the table on its
+        # key like `stream` and sort afterwards, rather than silently returning the first page
+        self._check(table, [*columns, *(eq or {}), *filter(None, [order])])
+        fetched = [*columns, *(column for column in [order] if column and column not in columns)]
+        rows = [row for page in self.stream(table, *fetched, eq=eq) for row in page]
+        if order:
+            # Nulls last, as Postgres sorts them
+            rows.sort(key=lambda row: (row[order] is None, row[order]))
+        return [{column: row[column] for column in columns} for row in rows]
+
+    def select_page(self, table, *columns, after=None, eq=None, limit=1000):
+        self._check(table, [*columns, *(eq or {})])
+        key = TABLES[table]["key"]
+        query = self.connection.table(table).select(*columns)
+        for column, value in (eq or {}).items():
+            query = query.eq(column, value)
+        if after is not None:
+            # (a, b) > (x, y)  becomes  a > x or (a = x and b > y)
+            terms = []
+            for index, column in enumerate(key):
+                conditions = [f"{key[previous]}.eq.{after[previous]}" for previous in range(index)] + [f"{column}.gt.{after[index]}"]
+                terms.append(conditions[0] if len(conditions) == 1 else f"and({','.join(conditions)})")
+            query = query.or_(",".join(terms))
+        for column in key:
+            query = query.order(column)
+        return query.limit(limit).execute().data
+
+    def update(self, table, values, eq):
+        self._check(table, [*values, *eq])
+        query = self.connection.table(table).update(values)
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        return query.execute().data
+
+    def upsert(self, table, rows):
+        if not rows:
+            return []
+        self._check(table, rows[0])
+        return self.connection.table(table).upsert(rows).execute().data
+
+    def delete(self, table, eq):
+        self._check(table, eq)
+        query = self.connection.table(table).delete()
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        return query.execute().data
+
+class SQLiteRepository(Repository):
+    """
+    Keeps the tables in a local SQLite database, in memory by default.
+
+    Useful for running benchmarks and tests offline, or as a fast local copy of the hosted
+    database (see `replicate`). Writes are announced to `feed` (a `ChangeFeed.LocalChangeFeed`)
+    if given.
+    """
+
+    def __init__(self, path=":memory:", feed=None):
+        self.feed = feed
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            for table, schema in TABLES.items():
+                columns = [f'"{column}" {kind}' for column, kind in schema["columns"].items()]
+                self.db.execute(f'CREATE TABLE IF NOT EXISTS {table} ({", ".join(columns)}, PRIMARY KEY ({self._quote(schema["key"])}))')
+                for index in schema.get("indexes", []):
+                    self.db.execute(f'CREATE INDEX IF NOT EXISTS {table}_{"_".join(index)} ON {table} ({self._quote(index)})')
+
+    def _quote(self, columns):
+        return ", ".join(f'"{column}"' for column in columns)
+
+    def _publish(self, table):
+        if self.feed is not None:
+            self.feed.publish(table)
+
+    def _where(self, eq):
+        if not eq:
+            return "", []
+        clause = " AND ".join(f'"{column}" = ?' for column in eq)
+        return f" WHERE {clause}", [self._value(value) for value in eq.values()]
+
+    def select(self, table, *columns, eq=None, order=None):
+        self._check(table, [*columns, *(eq or {})])
+        if order:
+            self._check(table, [order])
+        where, params = self._where(eq)
+        sql = f"SELECT {self._quote(columns)} FROM {table}{where}"
+        if order:
+            sql += f' ORDER BY "{order}"'
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql, params)]
+
+    def select_page(self, table, *columns, after=None, eq=None, limit=1000):
+        self._check(table, [*columns, *(eq or {})])
+        key = TABLES[table]["key"]
+        where, params = self._where(eq)
+        if after is not None:
+            keyset = f"({self._quote(key)}) > ({', '.join('?' for _ in key)})"
+            where = f"{where} AND {keyset}" if where else f" WHERE {keyset}"
+            params += [self._value(value) for value in after]
+        sql = f"SELECT {self._quote(columns)} FROM {table}{where} ORDER BY {self._quote(key)} LIMIT ?"
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql, params + [limit])]
+
+    def update(self, table, values, eq):
+        self._check(table, [*values, *eq])
+        where, params = self._where(eq)
+        assignments = ", ".join(f'"{column}" = ?' for column in values)
+        with self.lock, self.db:
+            self.db.execute(f"UPDATE {table} SET {assignments}{where}", [self._value(value) for value in values.values()] + params)
+        self._publish(table)
+        return self.select(table, *TABLES[table]["columns"], eq=eq)
+
+    def upsert(self, table, rows):
+        if not rows:
+            return []
+        columns = list(rows[0])
+        self._check(table, columns)
+        key = TABLES[table]["key"]
+        updates = [column for column in columns if column not in key]
+        sql = (
+            f"INSERT INTO {table} ({self._quote(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT ({self._quote(key)}) "
+        )
+        if updates:
+            sql += "DO UPDATE SET " + ", ".join(f'"{column}" = excluded."{column}"' for column in updates)
+        else:
+            sql += "DO NOTHING"
+        with self.lock, self.db:
+            self.db.executemany(sql, ([self._value(row[column]) for column in columns] for row in rows))
+        self._publish(table)
+        return rows
+
+    def delete(self, table, eq):
+        self._check(table, eq)
+        where, params = self._where(eq)
+        with self.lock, self.db:
+            self.db.execute(f"DELETE FROM {table}{where}", params)
+        self._publish(table)
+        return []
+
+    def replicate(self, source):
+        """Copies every table from the `source` repository into this one."""
+        for table, schema in TABLES.items():
+            self.upsert(table, source.select(table, *schema["columns"]))
+
+class ParquetRepository(Repository):
+    """
+    Serves the tables read-only from a Parquet snapshot directory written by `Snapshot.export`,
+    for when the hosted database is slow or down, or to profile and replay against real data
+    offline. The files are opened lazily: only their metadata is read up front, and each query
+    reads just the columns it asks for, from the row groups its filters can match.
+    """
+
+    read_only = True
+
+    def __init__(self, path):
+        import pyarrow.dataset as ds
+
+        self.path = path
+        self.tables = {
+            table: ds.dataset(f"{path}/{table}.parquet", format="parquet")
+            for table in TABLES
+        }
+
+    def _filter(self, eq):
+        import pyarrow.dataset as ds
+
+        expression = None
+        for column, value in (eq or {}).items():
+            condition = ds.field(column) == self._value(value)
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def _after(self, table, after):
+        import pyarrow.dataset as ds
+
+        # Rows whose key sorts after `after`, e.g. (a > x) | (a == x & b > y) for a two column key
+        key = TABLES[table]["key"]
+        after = [self._value(value) for value in after]
+        expression = ds.field(key[-1]) > after[-1]
+        for column, value in zip(key[-2::-1], after[-2::-1]):
+            expression = (ds.field(column) > value) | ((ds.field(column) == value) & expression)
+        return expression
+
+    def _rows(self, data, columns):
+        # Arrow's own `to_pylist` converts value by value, going through NumPy is a lot faster
+        # for the columns where it gives the same values (ints with nulls would become floats)
+        def values(column):
+            if column.null_count == 0 or column.type == "string":
+                return column.to_numpy(zero_copy_only=False).tolist()
+            return column.to_pylist()
+        return [dict(zip(columns, row)) for row in zip(*(values(data[column]) for column in columns))]
+
+    def select(self, table, *columns, eq=None, order=None):
+        self._check(table, [*columns, *(eq or {})])
+        if order:
+            self._check(table, [order])
+        data = self.tables[table].to_table(columns=list(dict.fromkeys([*columns, *filter(None, [order])])), filter=self._filter(eq))
+        if order:
+            data = data.sort_by(order)
+        return self._rows(data, columns)
+
+    def select_page(self, table, *columns, after=None, eq=None, limit=1000):
+        self._check(table, [*columns, *(eq or {})])
+        expression = self._filter(eq)
+        if after is not None:
+            # Snapshots are written in key order, so the page is the first rows after `after`
+            expression = self._after(table, after) if expression is None else expression & self._after(table, after)
+        return self._rows(self.tables[table].head(limit, columns=list(columns), filter=expression), columns)
+
+    def _read_only(self, table):
+        raise ReadOnlyError(f"Can't change '{table}', the app is serving the read-only snapshot at {self.path}")
+
+    def update(self, table, values, eq):
+        self._read_only(table)
+
+    def upsert(self, table, rows):
+        self._read_only(table)
+
+    def delete(self, table, eq):
+        self._read_only(table)
@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+
+GROUP_CATEGORIES = ['group_home_goals', 'group_away_goals', 'group_result', 'group_perfect_prediction']
+
+# The league's scoring rules: points for each hit in a scoring category
+CATEGORY_POINTS = {
+    'group_home_goals': 1,
+    'group_away_goals': 1,
+    'group_result': 3,
+    'group_perfect_prediction': 3,
+    'round_of_16': 3,
+    'quarter_finals': 4,
+    'semi_finals': 6,
+    'finals': 8,
+    'tournament_winner': 20,
+}
+
+####################################################################################################
+# Rules
+####################################################################################################
+
+# Every scoring category, in the order of the columns of a hits matrix: one row per member
+# holding how many hits they have in each category. Scoring rules like `CATEGORY_POINTS` are
+# compiled into weights, so points are a single matrix product of hits and weights however many
+# members, categories or sets of rules there are.
+CATEGORIES = list(CATEGORY_POINTS)
+
+def compile_rules(*rules):
+    """
+    Compiles sets of scoring rules, dicts of points per hit for any of the `CATEGORIES` (the
+    others don't score), into a weights matrix with a row per category and a column per set of
+    rules, for `score_hits`.
+    """
+    unknown = {category for rule in rules for category in rule} - set(CATEGORIES)
+    if unknown:
+        raise ValueError(f"Unknown scoring categories: {', '.join(sorted(unknown))}")
+    return np.array([[rule.get(category, 0) for rule in rules] for category in CATEGORIES], dtype='int64').reshape(len(CATEGORIES), len(rules))
+
+# The league's rules, compiled
+WEIGHTS = compile_rules(CATEGORY_POINTS)[:, 0]
+
+def category_weights(categories):
+    """The league's points per hit for each of `categories`, as an array."""
+    codes = pd.Index(CATEGORIES).get_indexer(categories)
+    if (codes < 0).any():
+        raise ValueError(f"Unknown scoring categories: {', '.join(sorted(set(np.asarray(categories)[codes < 0])))}")
+    return WEIGHTS[codes]
+
+def score_hits(hits, weights=WEIGHTS):
+    """
+    Scores a hits matrix (see `CATEGORIES`) under compiled rules (see `compile_rules`). Returns
+    each member's points, one column per set of rules for a weights matrix.
+    """
+    return np.asarray(hits, dtype='int64') @ weights
+
+def ledger_hits(ledger, member_ids):
+    """
+    Builds the hits matrix of `member_ids` from points ledger rows. Members without any rows get a
+    row of zeros.
+    """
+    members = pd.Index(member_ids).get_indexer(ledger['member_id'])
+    categories = pd.Index(CATEGORIES).get_indexer(ledger['category'])
+    known = (members >= 0) & (categories >= 0)
+    return np.bincount(
+        members[known] * len(CATEGORIES) + categories[known],
+        weights=ledger['hits'].to_numpy(dtype='int64')[known],
+        minlength=len(member_ids) * len(CATEGORIES),
+    ).astype('int64').reshape(len(member_ids), len(CATEGORIES))
+
+def ledger_points(ledger):
+    """The points each points ledger row is worth under the league's rules."""
+    return pd.Series(ledger['hits'].to_numpy(dtype='int64') * category_weights(ledger['category']), index=ledger.index, name='points')
+
+####################################################################################################
+# Group stage
+####################################################################################################
+
+def _as_float(column):
+    # Missing goals (unplayed matches, blank predictions) become NaN so every comparison is False
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+def score_group_predictions(df):
+    """
+    Scores every prediction in `df` in one columnar pass.
+
+    `df` needs the actual `home_goals`/`away_goals` and the predicted
+    `home_goals_prediction`/`away_goals_prediction` columns. Returns a DataFrame with the same
+    index holding a 0/1 column for each of the group scoring categories.
+    """
+    home_goals = _as_float(df['home_goals'])
+    away_goals = _as_float(df['away_goals'])
+    home_prediction = _as_float(df['home_goals_prediction'])
+    away_prediction = _as_float(df['away_goals_prediction'])
+
+    home_hit = home_goals == home_prediction
+    away_hit = away_goals == away_prediction
+    # Same winner, or both a draw
+    result_hit = ((home_goals - away_goals) * (home_prediction - away_prediction) > 0) | \
+                 ((home_goals == away_goals) & (home_prediction == away_prediction))
+
+    return pd.DataFrame({
+        'group_home_goals': home_hit.astype('int64'),
+        'group_away_goals': away_hit.astype('int64'),
+        'group_result': result_hit.astype('int64'),
+        'group_perfect_prediction': (home_hit & away_hit).astype('int64'),
+    }, index=df.index)
+
+def score_group_stage(df):
+    """
+    Totals the group scoring categories per member.
+
+    `df` holds one row per prediction (see `score_group_predictions`) plus a `member_id` column.
+    Every member with a prediction gets a row, even if none of their matches have been played.
+    """
+    points = score_group_predictions(df)
+    points.insert(0, 'member_id', df['member_id'].to_numpy())
+    return points.groupby('member_id', sort=False).sum().reset_index()
+
+def score_match_delta(predictions, old_home_goals, old_away_goals, home_goals, away_goals):
+    """
+    Works out how each member's group totals change when one match's score goes from
+    `old_home_goals`:`old_away_goals` (None if it had no score yet) to `home_goals`:`away_goals`.
+
+    `predictions` holds that match's `member_id`, `home_goals_prediction` and
+    `away_goals_prediction`. Members whose points don't change are left out.
+    """
+    old = predictions.assign(home_goals=old_home_goals, away_goals=old_away_goals)
+    new = predictions.assign(home_goals=home_goals, away_goals=away_goals)
+    delta = score_group_predictions(new) - score_group_predictions(old)
+    delta.insert(0, 'member_id', predictions['member_id'].to_numpy())
+    delta = delta.groupby('member_id', sort=False).sum().reset_index()
+    return delta[(delta[GROUP_CATEGORIES] != 0).any(axis=1)].reset_index(drop=True)
+
+####################################################################################################
+# Knockout stages
+####################################################################################################
+
+# Knockout stages, and the standings column their points go in
+KNOCKOUT_STAGES = {
+    'Round of 16': 'round_of_16',
+    'Quarter finals': 'quarter_finals',
+    'Semi finals': 'semi_finals',
+    'Finals': 'finals',
+}
+
+def _knockout_hits(matches, predictions):
+    """
+    Finds every team a member correctly predicted would play in a knockout stage.
+
+    Returns the ids of the members with a knockout prediction and, for each correctly predicted
+    (member, stage, team), the member's index into those ids, the stage's index into
+    `KNOCKOUT_STAGES` and the number of the match the team plays in that stage.
+    """
+    stages = list(KNOCKOUT_STAGES)
+    knockout_matches = matches[matches['stage'].isin(stages)]
+    is_knockout = predictions['match_number'].isin(knockout_matches['number']).to_numpy()
+
+    # Stage index of each knockout match and prediction
+    stage_of_match = pd.Series(knockout_matches['stage'].map(stages.index).to_numpy(), index=knockout_matches['number'])
+    match_stages = stage_of_match.to_numpy()
+    prediction_stages = stage_of_match.reindex(predictions['match_number'].to_numpy()[is_knockout]).to_numpy()
+
+    # Teams as integer codes shared by the actual and predicted teams, missing teams become -1
+    team_codes, teams = pd.factorize(np.concatenate([
+        knockout_matches['home'].to_numpy(dtype=object), knockout_matches['away'].to_numpy(dtype=object),
+        predictions['home_team_prediction'].to_numpy(dtype=object)[is_knockout], predictions['away_team_prediction'].to_numpy(dtype=object)[is_knockout],
+    ]))
+    home, away, home_prediction, away_prediction = np.split(team_codes, np.cumsum([len(knockout_matches)] * 2 + [is_knockout.sum()]))
+    width = len(teams) + 1
+
+    # The match each actual (stage, team) pair plays in as a lookup table, zero if the team isn't
+    # in that stage. The extra last column catches missing teams.
+    match_of = np.zeros((len(stages), width), dtype='int64')
+    match_of[match_stages, home] = knockout_matches['number'].to_numpy()
+    match_of[match_stages, away] = knockout_matches['number'].to_numpy()
+    match_of[:, -1] = 0
+
+    # Melt the home and away predictions into (member, stage, team), keep the ones that join
+    # against an actual (stage, team), and de-duplicate them so each team scores once per stage
+    member_codes, member_ids = pd.factorize(predictions['member_id'].to_numpy()[is_knockout])
+    hits = []
+    for predicted_teams in (home_prediction, away_prediction):
+        correct = match_of[prediction_stages, predicted_teams] > 0
+        hits.append(((member_codes[correct] * len(stages) + prediction_stages[correct]) * width) + predicted_teams[correct])
+    hits = np.unique(np.concatenate(hits))
+
+    team, stage, member = hits % width, (hits // width) % len(stages), hits // (width * len(stages))
+    return member_ids, member, stage, match_of[stage, team]
+
+def match_winner(home, away, home_goals, away_goals, home_penalties=None, away_penalties=None):
+    """Returns the team that won the match, on penalties if it was a draw, or None if it can't tell."""
+    if pd.isna(home_goals) or pd.isna(away_goals) or home_goals == "" or away_goals == "":
+        return None
+    home_goals, away_goals = int(home_goals), int(away_goals)
+    if home_goals == away_goals:
+        if pd.isna(home_penalties) or pd.isna(away_penalties) or home_penalties == "" or away_penalties == "":
+            return None
+        home_goals, away_goals = int(home_penalties), int(away_penalties)
+    if home_goals == away_goals:
+        return None
+    return home if home_goals > away_goals else away
+
+####################################################################################################
+# Points ledger
+####################################################################################################
+
+LEDGER_COLUMNS = ['member_id', 'match_number', 'category', 'hits']
+
+def group_ledger(df):
+    """
+    Turns scored group predictions into points ledger rows, one per member, match and category
+    that scored, holding the hits. `df` is as for `score_group_predictions`, plus `member_id` and
+    `match_number`.
+    """
+    points = score_group_predictions(df)
+    points.insert(0, 'member_id', df['member_id'].to_numpy())
+    points.insert(1, 'match_number', df['match_number'].to_numpy())
+    ledger = points.melt(id_vars=['member_id', 'match_number'], var_name='category', value_name='hits')
+    return ledger[ledger['hits'] > 0].reset_index(drop=True)
+
+def knockout_ledger(matches, predictions):
+    """
+    Turns the knockout stage hits, every team a member correctly predicted would play in a stage,
+    into points ledger rows. Each correctly predicted team is credited to the match it plays in
+    that stage.
+    """
+    member_ids, member, stage, match_number = _knockout_hits(matches, predictions)
+    ledger = pd.DataFrame({
+        'member_id': member_ids[member],
+        'match_number': match_number,
+        'category': np.array(list(KNOCKOUT_STAGES.values()))[stage],
+    })
+    return ledger.groupby(['member_id', 'match_number', 'category']).size().rename('hits').reset_index()
@@ -0,0 +1,360 @@
+import os
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+import Scoring
+from concurrent.futures import ProcessPoolExecutor
+
+# Monte Carlo simulation of the rest of the tournament. Unplayed matches get Poisson distributed
+# goals from each team's attacking and defensive form so far, knockout winners go through to their
+# `next_game` and every member is scored against each simulated outcome with the same rules as the
+# standings. Run many outcomes and count how often each member finishes in each position.
+
+SIMULATIONS = 20_000
+# Outcomes simulated at once by a worker, bounds the memory used per member
+BATCH_SIZE = 500
+# How many of the top positions each member's chances are counted for, so the counts stay small
+# however many members there are
+TOP_POSITIONS = 10
+# Simulated goals are capped here, as are predictions when they are scored
+MAX_GOALS = 9
+# How many matches of average form each team starts with, so a few results don't swing it too far
+PRIOR_MATCHES = 3
+
+# Who plays in the round of 16 when it isn't known yet: a group winner ("1A"), runner up ("2C") or
+# one of the four best third placed teams from the listed groups ("3ADEF"), as in the Euro 2024 bracket
+ROUND_OF_16_SLOTS = {
+    37: ("1A", "2C"), 38: ("2A", "2B"), 39: ("1B", "3ADEF"), 40: ("1C", "3DEF"),
+    41: ("1F", "3ABC"), 42: ("2D", "2E"), 43: ("1E", "3ABCD"), 44: ("1D", "2F"),
+}
+
+####################################################################################################
+# Scoring
+####################################################################################################
+
+def _outcome(home_goals, away_goals):
+    # A scoreline as a single integer code
+    return home_goals * (MAX_GOALS + 1) + away_goals
+
+def _group_points_table():
+    """
+    The group points earned by every predicted scoreline (columns) for every actual scoreline
+    (rows), scored with `Scoring.score_group_predictions`. The extra last column is a missing
+    prediction, which never scores.
+    """
+    goals = np.arange(MAX_GOALS + 1)
+    actual, predicted = np.meshgrid(np.arange(len(goals) ** 2), np.arange(len(goals) ** 2), indexing='ij')
+    df = pd.DataFrame({
+        'home_goals': actual.ravel() // len(goals),
+        'away_goals': actual.ravel() % len(goals),
+        'home_goals_prediction': predicted.ravel() // len(goals),
+        'away_goals_prediction': predicted.ravel() % len(goals),
+    })
+    hits = Scoring.score_group_predictions(df)
+    points = hits[Scoring.GROUP_CATEGORIES].to_numpy() @ Scoring.category_weights(Scoring.GROUP_CATEGORIES)
+    points = points.reshape(len(goals) ** 2, len(goals) ** 2)
+    return np.hstack([points, np.zeros((len(points), 1), dtype=points.dtype)])
+
+def _third_place_slots(slots):
+    """
+    For each set of four groups (as a bitmask of group indexes) whose third placed teams go
+    through, the group each third place slot is given, in `slots` order.
+    """
+    table = np.full((64, len(slots)), -1, dtype='int64')
+    for groups in itertools.combinations(range(6), len(slots)):
+        mask = sum(1 << group for group in groups)
+        for order in itertools.permutations(groups):
+            if all(group in allowed for group, allowed in zip(order, slots)):
+                table[mask] = order
+                break
+    return table
+
+####################################################################################################
+# Preparing the tournament
+####################################################################################################
+
+def prepare(matches, members, predictions):
+    """
+    Turns the `matches`, `members` and `predictions` tables into the NumPy arrays the simulation
+    works on. Teams, members and matches become integer codes.
+    """
+    matches = matches.sort_values('number').reset_index(drop=True)
+    is_group = (matches['stage'] == 'Group').to_numpy()
+    group_matches, knockout_matches = matches[is_group], matches[~is_group]
+    teams = pd.Index(sorted(set(group_matches['home']) | set(group_matches['away'])))
+    groups = sorted(group_matches['group'].dropna().unique())
+
+    def team_codes(column):
+        return teams.get_indexer(column.to_numpy(dtype=object))
+
+    def goals(column):
+        return pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+    # Form from every match played so far
+    home, away = team_codes(matches['home']), team_codes(matches['away'])
+    home_goals, away_goals = goals(matches['home_goals']), goals(matches['away_goals'])
+    played = ~np.isnan(home_goals) & ~np.isnan(away_goals) & (home >= 0) & (away >= 0)
+    games = np.bincount(home[played], minlength=len(teams)) + np.bincount(away[played], minlength=len(teams))
+    scored = np.bincount(home[played], home_goals[played], len(teams)) + np.bincount(away[played], away_goals[played], len(teams))
+    conceded = np.bincount(home[played], away_goals[played], len(teams)) + np.bincount(away[played], home_goals[played], len(teams))
+    average = (home_goals[played].sum() + away_goals[played].sum()) / max(2 * played.sum(), 1) or 1.3
+    attack = (scored + PRIOR_MATCHES * average) / (games + PRIOR_MATCHES) / average
+    defence = (conceded + PRIOR_MATCHES * average) / (games + PRIOR_MATCHES) / average
+
+    # Group matches
+    group_played = played[is_group]
+    group_home, group_away = home[is_group], away[is_group]
+    group_of_team = np.full(len(teams), -1)
+    group_index = [groups.index(group) for group in group_matches['group']]
+    group_of_team[group_home] = group_index
+    group_of_team[group_away] = group_index
+    group_teams = np.array([np.flatnonzero(group_of_team == group) for group in range(len(groups))])
+
+    # Knockout matches, in the order they're played, with where their winner goes
+    number_index = {number: index for index, number in enumerate(knockout_matches['number'])}
+    third_slots = []
+    knockout = []
+    for match in knockout_matches.to_dict('records'):
+        entry = {
+            'number': match['number'],
+            'stage': list(Scoring.KNOCKOUT_STAGES).index(match['stage']),
+            'teams': [teams.get_loc(match[side]) if match[side] in teams else -1 for side in ('home', 'away')],
+            'winner': -1,
+            'next': None,
+            'slots': [None, None],
+        }
+        if all(team >= 0 for team in entry['teams']):
+            winner = Scoring.match_winner(match['home'], match['away'], match['home_goals'], match['away_goals'], match.get('home_penalties'), match.get('away_penalties'))
+            entry['winner'] = teams.get_loc(winner) if winner is not None else -1
+        if isinstance(match.get('next_game'), str):
+            next_number, side = match['next_game'].split('-')
+            entry['next'] = (number_index[int(next_number)], 0 if side == 'home' else 1)
+        for side, slot in enumerate(ROUND_OF_16_SLOTS.get(match['number'], ())):
+            if slot[0] == '3':
+                third_slots.append({groups.index(group) for group in slot[1:]})
+                entry['slots'][side] = ('3', len(third_slots) - 1)
+            else:
+                entry['slots'][side] = (int(slot[0]) - 1, groups.index(slot[1]))
+        knockout.append(entry)
+
+    # Predictions as (member, match) grids
+    member_ids = members['id'].to_numpy()
+    member_index = pd.Index(member_ids)
+    match_numbers = matches['number'].to_numpy()
+    rows = member_index.get_indexer(predictions['member_id'].to_numpy())
+    columns = pd.Index(match_numbers).get_indexer(predictions['match_number'].to_numpy())
+    known = (rows >= 0) & (columns >= 0)
+    rows, columns = rows[known], columns[known]
+
+    predicted_home, predicted_away = goals(predictions['home_goals_prediction'])[known], goals(predictions['away_goals_prediction'])[known]
+    valid = ~np.isnan(predicted_home) & ~np.isnan(predicted_away)
+    scoreline = np.full((len(member_ids), len(matches)), (MAX_GOALS + 1) ** 2, dtype='int64')
+    scoreline[rows[valid], columns[valid]] = _outcome(
+        np.clip(predicted_home[valid], 0, MAX_GOALS).astype('int64'),
+        np.clip(predicted_away[valid], 0, MAX_GOALS).astype('int64'),
+    )
+
+    # The teams each member predicted in each knockout stage
+    stage_of_match = np.full(len(matches), -1)
+    stage_of_match[~is_group] = [entry['stage'] for entry in knockout]
+    stages = stage_of_match[columns]
+    predicted_stage_teams = np.zeros((len(member_ids), len(Scoring.KNOCKOUT_STAGES), len(teams)), dtype=bool)
+    for column in ('home_team_prediction', 'away_team_prediction'):
+        team = teams.get_indexer(predictions[column].to_numpy(dtype=object)[known])
+        hit = (stages >= 0) & (team >= 0)
+        predicted_stage_teams[rows[hit], stages[hit], team[hit]] = True
+
+    # Group points already earned are fixed, only the unplayed matches are simulated
+    points_table = _group_points_table()
+    played_outcomes = _outcome(home_goals[is_group][group_played].astype('int64'), away_goals[is_group][group_played].astype('int64'))
+    group_scoreline = scoreline[:, is_group]
+    fixed_points = points_table[played_outcomes[None, :], group_scoreline[:, group_played]].sum(axis=1)
+
+    winning_team = teams.get_indexer(members['winning_team'].to_numpy(dtype=object)) if 'winning_team' in members else np.full(len(member_ids), -1)
+
+    return {
+        'teams': teams.to_numpy(),
+        'member_ids': member_ids,
+        'attack': attack,
+        'defence': defence,
+        'average': average,
+        'group_home': group_home,
+        'group_away': group_away,
+        'group_home_goals': np.nan_to_num(home_goals[is_group]).astype('int64'),
+        'group_away_goals': np.nan_to_num(away_goals[is_group]).astype('int64'),
+        'group_played': group_played,
+        'group_teams': group_teams,
+        'third_slots': _third_place_slots(third_slots) if third_slots else None,
+        'knockout': knockout,
+        'points_table': points_table,
+        'fixed_points': fixed_points,
+        'unplayed_scoreline': group_scoreline[:, ~group_played],
+        'predicted_stage_teams': predicted_stage_teams.reshape(len(member_ids), -1).astype('float64'),
+        'winning_team': winning_team,
+    }
+
+####################################################################################################
+# Simulating
+####################################################################################################
+
+def _goals(rng, tournament, home, away):
+    rate = tournament['average'] * tournament['attack'][home] * tournament['defence'][away]
+    return np.minimum(rng.poisson(rate), MAX_GOALS)
+
+def _group_positions(rng, tournament, home_goals, away_goals):
+    """Ranks each group by points, goal difference then goals scored, with ties broken at random."""
+    home, away = tournament['group_home'], tournament['group_away']
+    teams = len(tournament['teams'])
+    home_points = 3 * (home_goals > away_goals) + (home_goals == away_goals)
+    away_points = 3 * (away_goals > home_goals) + (home_goals == away_goals)
+
+    def per_team(home_values, away_values):
+        totals = np.zeros((len(home_goals), teams))
+        np.add.at(totals.T, home, home_values.T)
+        np.add.at(totals.T, away, away_values.T)
+        return totals
+
+    points = per_team(home_points, away_points)
+    difference = per_team(home_goals - away_goals, away_goals - home_goals)
+    scored = per_team(home_goals, away_goals)
+    key = points * 1e6 + (difference + 500) * 1e3 + scored + rng.random(points.shape)
+
+    # The teams of each group from first to last, and the key they were ranked on
+    group_teams = tournament['group_teams']
+    group_keys = key[:, group_teams]
+    order = np.argsort(-group_keys, axis=2)
+    ranked = np.take_along_axis(np.broadcast_to(group_teams, group_keys.shape), order, axis=2)
+    return ranked, np.take_along_axis(group_keys, order, axis=2)
+
+def _simulate_batch(rng, tournament, simulations):
+    """Simulates `simulations` outcomes, returning every member's total points in each."""
+    batch = np.arange(simulations)
+
+    # Group stage
+    home_goals = np.broadcast_to(tournament['group_home_goals'], (simulations, len(tournament['group_home']))).copy()
+    away_goals = np.broadcast_to(tournament['group_away_goals'], home_goals.shape).copy()
+    unplayed = ~tournament['group_played']
+    home, away = tournament['group_home'][unplayed], tournament['group_away'][unplayed]
+    home_goals[:, unplayed] = _goals(rng, tournament, np.broadcast_to(home, (simulations, len(home))), np.broadcast_to(away, (simulations, len(away))))
+    away_goals[:, unplayed] = _goals(rng, tournament, np.broadcast_to(away, (simulations, len(away))), np.broadcast_to(home, (simulations, len(home))))
+
+    points = np.broadcast_to(tournament['fixed_points'].astype('float64'), (simulations, len(tournament['member_ids']))).copy()
+    outcomes = _outcome(home_goals[:, unplayed], away_goals[:, unplayed])
+    for match in range(outcomes.shape[1]):
+        points += tournament['points_table'][outcomes[:, match][:, None], tournament['unplayed_scoreline'][None, :, match]]
+
+    # Knockout stages
+    ranked = third_teams = None
+    stage_teams = np.zeros((simulations, len(Scoring.KNOCKOUT_STAGES), len(tournament['teams'])))
+    entrants = {}
+    champion = np.full(simulations, -1)
+    for index, match in enumerate(tournament['knockout']):
+        sides = []
+        for side in range(2):
+            team = np.full(simulations, match['teams'][side])
+            if match['teams'][side] < 0 and (index, side) in entrants:
+                team = entrants[(index, side)]
+            elif match['teams'][side] < 0 and match['slots'][side] is not None:
+                if ranked is None:
+                    ranked, keys = _group_positions(rng, tournament, home_goals, away_goals)
+                    # The best four third placed teams, and the groups they come from as a bitmask
+                    best_thirds = np.argsort(-keys[:, :, 2], axis=1)[:, :4]
+                    third_teams = tournament['third_slots'][(1 << best_thirds).sum(axis=1)]
+                    third_teams = ranked[batch[:, None], third_teams, 2]
+                position, group = match['slots'][side]
+                team = third_teams[:, group] if position == '3' else ranked[:, group, position]
+            sides.append(team)
+        home, away = sides
+        known = (home >= 0) & (away >= 0)
+        stage_teams[batch[home >= 0], match['stage'], home[home >= 0]] = 1
+        stage_teams[batch[away >= 0], match['stage'], away[away >= 0]] = 1
+
+        # Played matches keep their winner, the rest are simulated with a coin toss for penalties
+        winner = np.full(simulations, match['winner'])
+        if match['winner'] < 0:
+            simulated_home = _goals(rng, tournament, np.where(known, home, 0), np.where(known, away, 0))
+            simulated_away = _goals(rng, tournament, np.where(known, away, 0), np.where(known, home, 0))
+            home_wins = (simulated_home > simulated_away) | ((simulated_home == simulated_away) & (rng.random(simulations) < 0.5))
+            winner = np.where(known, np.where(home_wins, home, away), -1)
+        if match['next'] is not None:
+            entrants[match['next']] = winner
+        else:
+            champion = winner
+
+    weights = np.repeat(Scoring.category_weights(list(Scoring.KNOCKOUT_STAGES.values())), len(tournament['teams']))
+    points += (stage_teams.reshape(simulations, -1) * weights) @ tournament['predicted_stage_teams'].T
+    points += Scoring.CATEGORY_POINTS['tournament_winner'] * ((champion[:, None] == tournament['winning_team'][None, :]) & (champion[:, None] >= 0))
+    return points
+
+def _simulate_chunk(tournament, simulations, seed, top_positions):
+    """
+    Runs `simulations` outcomes in batches. Returns, per member, their share of first places (a
+    tie splits the win), the sum and the best of their positions, and how often they finished in
+    each of the `top_positions` top positions.
+    """
+    rng = np.random.default_rng(seed)
+    members = len(tournament['member_ids'])
+    wins = np.zeros(members)
+    position_sum = np.zeros(members, dtype='int64')
+    best = np.full(members, members, dtype='int64')
+    top = np.zeros((members, top_positions), dtype='int64')
+    for start in range(0, simulations, BATCH_SIZE):
+        points = _simulate_batch(rng, tournament, min(BATCH_SIZE, simulations - start))
+        leaders = points == points.max(axis=1, keepdims=True)
+        wins += (leaders / leaders.sum(axis=1, keepdims=True)).sum(axis=0)
+        # Members on the same points share the higher position
+        ranks = pd.DataFrame(points).rank(axis=1, method='min', ascending=False).to_numpy(dtype='int64') - 1
+        position_sum += ranks.sum(axis=0)
+        best = np.minimum(best, ranks.min(axis=0))
+        counted = ranks < top_positions
+        top += np.bincount(
+            (np.broadcast_to(np.arange(members), ranks.shape) * top_positions + ranks)[counted], minlength=members * top_positions,
+        ).reshape(members, top_positions)
+    return wins, position_sum, best, top
+
+# The tournament a worker process simulates, sent once when the worker starts rather than with
+# every chunk of simulations
+_tournament = None
+
+def _start_worker(tournament):
+    global _tournament
+    _tournament = tournament
+
+def _simulate_worker_chunk(simulations, seed, top_positions):
+    return _simulate_chunk(_tournament, simulations, seed, top_positions)
+
+def simulate(matches, members, predictions, simulations=SIMULATIONS, workers=None, seed=None, top_positions=TOP_POSITIONS):
+    """
+    Simulates the rest of the tournament `simulations` times, spread over a pool of `workers`
+    processes (one per CPU if None, none at all if 1).
+
+    `matches` needs every column of the `matches` table, `members` needs `id` and `winning_team`
+    and `predictions` the `member_id`, `match_number`, goal and team prediction columns. Returns
+    one row per member with their `win_probability`, `expected_position`, `best_position` and
+    `positions`, the probability of finishing in each of the first `top_positions` positions.
+    """
+    tournament = prepare(matches, members, predictions)
+    members_count = len(tournament['member_ids'])
+    result = pd.DataFrame({'member_id': tournament['member_ids']})
+    if not members_count:
+        return result.assign(win_probability=[], expected_position=[], best_position=[], positions=[])
+
+    top_positions = min(top_positions, members_count)
+    workers = workers or os.cpu_count() or 1
+    # One chunk per worker, so each worker is only sent the tournament once
+    sizes = [len(chunk) for chunk in np.array_split(np.arange(simulations), workers) if len(chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if len(sizes) == 1:
+        results = [_simulate_chunk(tournament, sizes[0], seeds[0], top_positions)]
+    else:
+        # Spawned rather than forked, forking copies the Streamlit server's threads and locks mid-use
+        with ProcessPoolExecutor(len(sizes), mp_context=multiprocessing.get_context("spawn"), initializer=_start_worker, initargs=(tournament,)) as pool:
+            results = list(pool.map(_simulate_worker_chunk, sizes, seeds, itertools.repeat(top_positions)))
+
+    wins, position_sum, best, top = zip(*results)
+    result['win_probability'] = sum(wins) / simulations
+    result['expected_position'] = sum(position_sum) / simulations + 1
+    result['best_position'] = np.minimum.reduce(best) + 1
+    result['positions'] = list(sum(top) / simulations)
+    return result
@@ -0,0 +1,88 @@
+"""
+Versioned Parquet snapshots of the app's tables, for serving the app read-only while the hosted
+database is down (see `Repository.ParquetRepository`) and as realistic data for offline profiling.
+
+Each snapshot is a directory named after the time it was taken, e.g. `snapshots/20240701-213000`,
+holding a `<table>.parquet` file per table and a `manifest.json` with the row counts.
+
+Usage: python Snapshot.py [--directory snapshots]
+
+exports the tables from the repository the app is configured to use (see `Common.get_repository`).
+"""
+import os
+import json
+import shutil
+import argparse
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import Repository
+
+DIRECTORY = os.environ.get("EURO_PREDICTIONS_SNAPSHOT_DIR", "snapshots")
+MANIFEST = "manifest.json"
+
+# Rows fetched per request, each chunk is written as one Parquet row group
+CHUNK_SIZE = 10_000
+
+def schema(table):
+    """The Arrow schema of `table`, from the column types in `Repository.TABLES`."""
+    types = {"INTEGER": pa.int64(), "TEXT": pa.string()}
+    return pa.schema([
+        (column, types[kind.split()[0]])
+        for column, kind in Repository.TABLES[table]["columns"].items()
+    ])
+
+def export(repo, directory=DIRECTORY, tables=tuple(Repository.TABLES)):
+    """
+    Writes every row of `tables` in `repo` to a new snapshot in `directory`, in key order, and
+    returns the snapshot's path. The snapshot only appears once it's complete.
+    """
+    taken = datetime.now()
+    path = os.path.join(directory, f"{taken:%Y%m%d-%H%M%S}")
+    partial = path + ".partial"
+    os.makedirs(partial)
+    try:
+        rows = {}
+        for table in tables:
+            table_schema = schema(table)
+            rows[table] = 0
+            with pq.ParquetWriter(os.path.join(partial, f"{table}.parquet"), table_schema) as writer:
+                for chunk in repo.stream(table, *table_schema.names, chunk_size=CHUNK_SIZE):
+                    writer.write_table(pa.Table.from_pylist(chunk, schema=table_schema))
+                    rows[table] += len(chunk)
+        with open(os.path.join(partial, MANIFEST), "w") as f:
+            json.dump({"taken": taken.isoformat(timespec="seconds"), "rows": rows}, f, indent=2)
+        os.rename(partial, path)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    return path
+
+def latest(directory=DIRECTORY):
+    """Returns the path of the most recent complete snapshot in `directory`."""
+    snapshots = sorted(
+        name for name in os.listdir(directory) if os.path.exists(os.path.join(directory, name, MANIFEST))
+    ) if os.path.isdir(directory) else []
+    if not snapshots:
+        raise FileNotFoundError(f"There are no snapshots in '{directory}', export one with `python Snapshot.py`")
+    return os.path.join(directory, snapshots[-1])
+
+def manifest(path):
+    """Returns when the snapshot at `path` was taken, and how many rows each table has."""
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--directory", default=DIRECTORY)
+    args = parser.parse_args()
+
+    import Common
+
+    path = export(Common.get_repository(), args.directory)
+    for table, rows in manifest(path)["rows"].items():
+        print(f"{table:<16} {rows:>10,} rows")
+    print(f"Snapshot written to {path}")
+
+if __name__ == "__main__":
+    main()
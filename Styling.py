@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+# Table styling for `Styler.apply(..., axis=None)`: each function takes the whole frame, works out
+# boolean masks over every row at once and returns a frame of CSS strings of the same shape.
+
+GREEN = 'background-color: green'
+ORANGE = 'background-color: orange'
+RED = 'background-color: red'
+
+def _goals(column):
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+def _paint(css, mask, columns, style):
+    for column in columns:
+        css[column] = np.where(mask, style, css[column])
+
+def _empty(df):
+    return pd.DataFrame('', index=df.index, columns=df.columns)
+
+def prediction_styles(df):
+    """Colours a member's predictions against the actual teams and results."""
+    css = _empty(df)
+    home_goals, away_goals = _goals(df['home_goals']), _goals(df['away_goals'])
+    home_prediction, away_prediction = _goals(df['home_goals_prediction']), _goals(df['away_goals_prediction'])
+
+    # Correct teams
+    home_team = (df['home'] == df['home_team_prediction']).to_numpy()
+    away_team = (df['away'] == df['away_team_prediction']).to_numpy()
+    _paint(css, home_team, ['home_team_prediction'], GREEN)
+    _paint(css, away_team, ['away_team_prediction'], GREEN)
+    _paint(css, home_team & away_team, ['home_team_prediction', 'away_team_prediction'], ORANGE)
+
+    # Results, only for the games that have been played
+    played = ~np.isnan(home_goals)
+    correct_result = np.sign(home_goals - away_goals) == np.sign(home_prediction - away_prediction)
+    home_hit = home_goals == home_prediction
+    away_hit = away_goals == away_prediction
+    _paint(css, played & correct_result, ['number'], GREEN)
+    _paint(css, played & ~correct_result, ['number'], RED)
+    _paint(css, home_hit, ['home'], GREEN)
+    _paint(css, away_hit, ['away'], GREEN)
+    _paint(css, home_hit & away_hit, ['number', 'home', 'away'], ORANGE)
+    return css
+
+def fixture_styles(df):
+    """Colours the winning team (green) or both teams of a draw (orange), and the score."""
+    css = _empty(df)
+    home_goals, away_goals = _goals(df['home_goals']), _goals(df['away_goals'])
+    _paint(css, home_goals > away_goals, ['home', 'score'], GREEN)
+    _paint(css, home_goals < away_goals, ['away', 'score'], GREEN)
+    _paint(css, home_goals == away_goals, ['home', 'away', 'score'], ORANGE)
+    return css
+
+def max_styles(df):
+    """Colours the highest value of each column green, unless the column is empty or all zeros."""
+    highest = df.max()
+    is_max = (df.eq(highest) & (highest.notna() & (highest != 0))).fillna(False).to_numpy(dtype=bool)
+    return pd.DataFrame(np.where(is_max, GREEN, ''), index=df.index, columns=df.columns)
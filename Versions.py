@@ -0,0 +1,34 @@
+import time
+import threading
+
+# A counter per table, bumped whenever the app writes to it. Cached readers take the versions of
+# the tables they read as an argument, so a write only invalidates the caches that depend on it.
+TABLES = ("matches", "members", "predictions", "points_ledger")
+
+# Writes made elsewhere (another server, or directly in the database) only bump the counters while
+# a change feed is live, see `ChangeFeed`. Until then the versions also roll over this often, so
+# nothing is cached for longer.
+FALLBACK_SECONDS = 300
+
+_versions = dict.fromkeys(TABLES, 0)
+_lock = threading.Lock()
+_live = False
+
+def get(*tables):
+    """Returns the current versions of `tables`, to use as part of a cache key."""
+    with _lock:
+        versions = tuple(_versions[table] for table in tables)
+    if _live:
+        return versions
+    return versions + (int(time.time() // FALLBACK_SECONDS),)
+
+def bump(*tables):
+    """Marks `tables` as changed, so cached reads of them are fetched again."""
+    with _lock:
+        for table in tables:
+            _versions[table] += 1
+
+def set_live(live):
+    """Records whether a change feed is bumping the versions as soon as a table changes anywhere."""
+    global _live
+    _live = live
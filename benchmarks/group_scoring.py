@@ -0,0 +1,40 @@
+"""
+Times the group stage scoring engine against a growing number of members.
+
+Usage: python benchmarks/group_scoring.py [--members 10 1000 10000 100000] [--repeat 3]
+"""
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Scoring
+import synthetic
+
+def make_group_predictions(members, seed=2024):
+    tables = synthetic.make_tournament(members, seed=seed)
+    group_matches = tables["matches"][tables["matches"]["stage"] == "Group"]
+    return pd.merge(group_matches, tables["predictions"], left_on='number', right_on='match_number')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--members', type=int, nargs='+', default=[10, 1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'members':>10} {'predictions':>12} {'best (s)':>10} {'us / member':>12}")
+    for members in args.members:
+        df = make_group_predictions(members)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            standings = Scoring.score_group_stage(df)
+            standings.to_dict('records')
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{members:>10} {len(df):>12} {best:>10.4f} {best / members * 1e6:>12.2f}")
+
+if __name__ == "__main__":
+    main()
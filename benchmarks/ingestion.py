@@ -0,0 +1,117 @@
+"""
+Times bulk loading predictions from a CSV export against a growing number of members.
+
+For each size a synthetic league's predictions, with the members' names and winning picks, are
+written to a CSV file, then loaded with `Ingestion` into a SQLite database holding only the
+fixture list, in a fresh process so its peak memory is the load's alone. Reported per size:
+the load's throughput and the peak resident memory of the loading process, which should stay flat
+as the file grows, then the time and peak memory of re-scoring the points ledger afterwards, which
+do grow with the league as the re-score reads every member's predictions.
+
+Usage: python benchmarks/ingestion.py [--members 1000 10000 100000] [--chunk-size 5000]
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Repository
+import synthetic
+from pipeline import RESULTS_DIR, git_revision
+
+# Members generated at a time, so writing the file doesn't need the whole league in memory
+BLOCK = 10_000
+
+# Runs in the child process
+CHILD = """
+import sys, json, time, resource
+import Common, Ingestion, Repository
+
+def peak_rss_mb():
+    # ru_maxrss carries over the parent's peak through exec on Linux, VmHWM doesn't
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 2**10
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+path, database, chunk_size = sys.argv[1], sys.argv[2], int(sys.argv[3])
+Common.set_repository(Repository.SQLiteRepository(database))
+report = Ingestion.ingest_predictions(Ingestion.read_rows(path, chunk_size), chunk_size, rescore_standings=False)
+report["errors"] = len(report["errors"])
+report["peak_rss_mb"] = peak_rss_mb()
+start = time.perf_counter()
+Ingestion.rescore()
+report["rescore_seconds"] = time.perf_counter() - start
+report["rescore_peak_rss_mb"] = peak_rss_mb()
+print(json.dumps(report))
+"""
+
+def write_predictions(path, members, seed=2024):
+    """Writes `members` members' predictions to a CSV file, a block of members at a time."""
+    for first in range(0, members, BLOCK):
+        tables = synthetic.make_tournament(min(BLOCK, members - first), seed=seed + first)
+        member_columns = tables["members"].rename(columns={"id": "member_id"})
+        rows = tables["predictions"].merge(member_columns, on="member_id")
+        rows["member_id"] += first
+        rows["name"] = "Member " + rows["member_id"].astype(str)
+        rows.to_csv(path, mode="a", header=first == 0, index=False)
+    return tables["matches"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--chunk-size", type=int, default=5_000)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/ingestion-<timestamp>.json)")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    results = []
+    print(f"{'members':>10} {'rows':>10} {'file (MB)':>10} {'seconds':>8} {'rows/s':>9} {'peak RSS (MB)':>14} {'rescore (s)':>12} {'peak RSS (MB)':>14}")
+    for members in args.members:
+        with tempfile.TemporaryDirectory() as directory:
+            path, database = os.path.join(directory, "predictions.csv"), os.path.join(directory, "league.sqlite")
+            matches = write_predictions(path, members)
+            repo = Repository.SQLiteRepository(database)
+            repo.upsert("matches", matches.astype(object).where(matches.notna(), None).to_dict("records"))
+
+            child = subprocess.run(
+                [sys.executable, "-c", CHILD, path, database, str(args.chunk_size)],
+                cwd=ROOT, capture_output=True, text=True, check=True,
+            )
+            report = json.loads(child.stdout.strip().splitlines()[-1])
+            result = {
+                "members": members,
+                "rows": report["rows"],
+                "file_mb": round(os.path.getsize(path) / 2**20, 1),
+                "seconds": round(report["seconds"], 3),
+                "rows_per_s": round(report["rows"] / report["seconds"]),
+                "peak_rss_mb": round(report["peak_rss_mb"], 1),
+                "rescore_s": round(report["rescore_seconds"], 3),
+                "rescore_peak_rss_mb": round(report["rescore_peak_rss_mb"], 1),
+                "rejected": report["rejected"],
+            }
+            results.append(result)
+            print(f"{members:>10} {result['rows']:>10} {result['file_mb']:>10.1f} {result['seconds']:>8.1f} {result['rows_per_s']:>9} {result['peak_rss_mb']:>14.1f} {result['rescore_s']:>12.1f} {result['rescore_peak_rss_mb']:>14.1f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"ingestion-{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "benchmark": "ingestion",
+            "started": started.isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "chunk_size": args.chunk_size,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
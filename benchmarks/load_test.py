@@ -0,0 +1,174 @@
+"""
+Load-tests the pages with many sessions at once, as when everyone opens the app after the final whistle.
+
+Every session is a Streamlit `AppTest` in this one process, like the sessions of one server, so
+they share its caches and each keeps its session state. They run against a SQLite copy of a
+synthetic league with the local change feed, as `EURO_PREDICTIONS_BACKEND=sqlite` would. `AppTest`
+can only run one script at a time per process, so the sessions take turns: the latencies are what
+each view costs the server, without waiting behind other sessions. For each number of sessions:
+
+- login: every session opens the dashboard and gets past the `check_password` gate
+- predictions: every session opens Predictions and switches between `--switches` members
+- fixtures: every session opens Fixtures & Results
+- after_update: an admin saves a score and the queued save is processed (see `Jobs`), which
+  refreshes the cached reads of matches and standings, then every session reruns the dashboard
+
+Reported per scenario: rerun latency percentiles, database queries per view and the process'
+resident memory afterwards. The results are written to a JSON file so runs can be compared.
+
+Usage: python benchmarks/load_test.py [--sessions 10 50 100] [--members 200] [--switches 3]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import ChangeFeed
+import Common
+import Database
+import Jobs
+import Repository
+import synthetic
+from pipeline import RESULTS_DIR, CountingRepository, git_revision
+from streamlit.testing.v1 import AppTest
+
+PASSWORD = "load-test"
+ADMIN_PASSWORD = "load-test-admin"
+
+def rss_mb():
+    """The process' resident memory now, or at its peak where that can't be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def new_session():
+    app = AppTest.from_file(os.path.join(ROOT, "streamlit_app.py"), default_timeout=600)
+    app.secrets["password"] = PASSWORD
+    app.secrets["admin_password"] = ADMIN_PASSWORD
+    return app
+
+def timed(run):
+    start = time.perf_counter()
+    app = run()
+    if app.exception:
+        raise RuntimeError(f"The page failed: {app.exception[0].value}")
+    return time.perf_counter() - start
+
+####################################################################################################
+# Scenarios, each returns the latency of every view it made
+####################################################################################################
+
+def login(app, args):
+    # The first run only shows the password box
+    app.run()
+    return [timed(lambda: app.text_input(key="password").input(PASSWORD).run())]
+
+def predictions(app, args):
+    latencies = [timed(lambda: app.switch_page("pages/Predictions.py").run())]
+    members = app.selectbox[0].options
+    for member in random.sample(members, min(args.switches, len(members))):
+        latencies.append(timed(lambda: app.selectbox[0].select(member).run()))
+    return latencies
+
+def fixtures(app, args):
+    return [timed(lambda: app.switch_page("pages/Fixtures.py").run())]
+
+def dashboard(app, args):
+    return [timed(lambda: app.switch_page("streamlit_app.py").run())]
+
+def update_score():
+    """Saves a new score for a random group match through the admin page."""
+    matches = Database.get_matches()
+    match = matches[matches['stage'] == "Group"].sample(1, random_state=random.randrange(2**32)).iloc[0]
+    admin = new_session()
+    admin.session_state["password_correct"] = admin.session_state["is_admin"] = True
+    admin.switch_page("pages/Admin_Update_Scores.py").run()
+    admin.selectbox[0].select(f"{match['date']}: {match['home']} vs {match['away']}").run()
+    admin.text_input[0].input(str(random.randint(0, 4)))
+    admin.text_input[1].input(str(random.randint(0, 4)))
+    admin.button(key="update_button").click().run()
+    if admin.exception or not admin.success:
+        raise RuntimeError("The admin couldn't update the score")
+    # Save it now rather than racing the background worker
+    Jobs.flush()
+
+####################################################################################################
+
+def run_scenario(name, scenario, sessions, repo, args):
+    queries = repo.queries
+    start = time.perf_counter()
+    latencies = [latency for app in sessions for latency in scenario(app, args)]
+    wall = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "sessions": len(sessions),
+        "scenario": name,
+        "views": len(latencies),
+        "wall_s": round(wall, 4),
+        "p50_s": round(p50, 4),
+        "p95_s": round(p95, 4),
+        "p99_s": round(p99, 4),
+        "max_s": round(max(latencies), 4),
+        "queries_per_view": round((repo.queries - queries) / len(latencies), 3),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--switches", type=int, default=3, help="Members each session looks at on Predictions")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/load_test-<timestamp>.json)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    started = datetime.now()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        repo = Repository.SQLiteRepository(os.path.join(directory, "league.sqlite"), feed=ChangeFeed.start(ChangeFeed.LocalChangeFeed()))
+        synthetic.populate(repo, args.members, seed=args.seed)
+        repo = CountingRepository(repo)
+        Common.set_repository(repo)
+        Jobs.start(os.path.join(directory, "jobs.sqlite"))
+        Database.rebuild_points_ledger()
+
+        print(f"{'sessions':>8} {'scenario':<14} {'views':>6} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'queries/view':>13} {'RSS (MB)':>9}")
+        for count in args.sessions:
+            sessions = [new_session() for _ in range(count)]
+            scenarios = [("login", login), ("predictions", predictions), ("fixtures", fixtures), ("after_update", dashboard)]
+            for name, scenario in scenarios:
+                if name == "after_update":
+                    update_score()
+                result = run_scenario(name, scenario, sessions, repo, args)
+                results.append(result)
+                print(f"{count:>8} {name:<14} {result['views']:>6} {result['p50_s']:>8.3f} {result['p95_s']:>8.3f} {result['p99_s']:>8.3f} {result['queries_per_view']:>13.2f} {result['rss_mb']:>9.1f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_test-{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "benchmark": "load_test",
+            "started": started.isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "members": args.members,
+            "seed": args.seed,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
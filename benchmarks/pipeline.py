@@ -0,0 +1,150 @@
+"""
+Times the scoring and standings pipeline against synthetic leagues of growing size.
+
+Every Database function used by the dashboard and the admin page runs against an in-memory
+SQLite repository loaded with `synthetic.make_tournament`. For each league size the wall time,
+peak Python memory and number of repository queries are reported, and the results are written
+to a JSON file so runs can be compared over time.
+
+Usage: python benchmarks/pipeline.py [--members 10 1000 10000 100000] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Common
+import Database
+import Repository
+import Scoring
+import Versions
+import synthetic
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Scoring rules to re-score every league under at once, see `Database.rescore`
+ALTERNATIVE_RULES = {
+    "league": Scoring.CATEGORY_POINTS,
+    "flat": dict.fromkeys(Scoring.CATEGORIES, 1),
+    "group_only": {category: Scoring.CATEGORY_POINTS[category] for category in Scoring.GROUP_CATEGORIES},
+    "double_knockouts": {
+        category: points * 2 if category in Scoring.KNOCKOUT_STAGES.values() else points
+        for category, points in Scoring.CATEGORY_POINTS.items()
+    },
+}
+
+class CountingRepository(Repository.Repository):
+    """Forwards to another repository, counting the queries made through it from any thread."""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.queries += 1
+
+    def select(self, table, *columns, **kwargs):
+        self._count()
+        return self.repo.select(table, *columns, **kwargs)
+
+    def select_page(self, table, *columns, **kwargs):
+        self._count()
+        return self.repo.select_page(table, *columns, **kwargs)
+
+    def update(self, table, values, eq):
+        self._count()
+        return self.repo.update(table, values, eq)
+
+    def upsert(self, table, rows):
+        self._count()
+        return self.repo.upsert(table, rows)
+
+    def delete(self, table, eq):
+        self._count()
+        return self.repo.delete(table, eq)
+
+def clear_caches():
+    Versions.bump(*Versions.TABLES)
+
+def cases(tables):
+    last_group_match = tables["matches"][tables["matches"]["stage"] == "Group"].iloc[-1]
+    return {
+        "recompute_group_standings": Database.recompute_group_standings,
+        "update_points_ledger": lambda: Database.update_points_ledger([int(last_group_match["number"])]),
+        "get_standings": Database.get_standings,
+        "get_knockout_round_points": Database.get_knockout_round_points,
+        "rebuild_points_ledger": Database.rebuild_points_ledger,
+        "get_position_history": Database.get_position_history,
+        "get_leaderboard": Database.get_leaderboard,
+        "rescore": lambda: Database.rescore(ALTERNATIVE_RULES),
+        "get_consensus": Database.get_consensus,
+    }
+
+def measure(repo, function):
+    # Time without tracing first, as tracemalloc slows allocation heavy code down
+    clear_caches()
+    repo.queries = 0
+    start = time.perf_counter()
+    function()
+    wall = time.perf_counter() - start
+    queries = repo.queries
+
+    clear_caches()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"wall_s": round(wall, 6), "peak_mb": round(peak / 2**20, 3), "queries": queries}
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, nargs="+", default=[10, 1_000, 10_000, 100_000])
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/pipeline-<timestamp>.json)")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    results = []
+    print(f"{'members':>8} {'function':<26} {'wall (s)':>10} {'peak (MB)':>10} {'queries':>8}")
+    for members in args.members:
+        repo = CountingRepository(Repository.SQLiteRepository())
+        tables = synthetic.populate(repo.repo, members, seed=args.seed)
+        Common.set_repository(repo)
+        Database.rebuild_points_ledger()
+        clear_caches()
+
+        for name, function in cases(tables).items():
+            result = {"members": members, "function": name, **measure(repo, function)}
+            results.append(result)
+            print(f"{members:>8} {name:<26} {result['wall_s']:>10.4f} {result['peak_mb']:>10.1f} {result['queries']:>8}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "benchmark": "pipeline",
+            "started": started.isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "seed": args.seed,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
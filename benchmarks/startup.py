@@ -0,0 +1,111 @@
+"""
+Times how long a fresh server process takes to paint each page, and how long a rerun takes.
+
+Each run starts a new Python process that renders the page with Streamlit's `AppTest` against a
+SQLite copy of a synthetic league, so imports, connections and caches all start cold. Reported
+per page (medians over the repeats):
+
+- first_paint_s: from starting the process until the first run of the page has finished
+- first_run_s: the first run of the page script itself, including the app's imports
+- rerun_s: a second run in the same session, as when a viewer clicks a widget
+
+The results are written to a JSON file so runs before and after a change can be compared.
+
+Usage: python benchmarks/startup.py [--members 20] [--repeats 5] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Common
+import Database
+import Repository
+import synthetic
+from pipeline import RESULTS_DIR, git_revision
+
+PAGES = ["streamlit_app.py", "pages/Fixtures.py", "pages/Predictions.py", "pages/Admin_Update_Scores.py"]
+
+# Runs in the child process, `started` is when the parent launched it
+CHILD = """
+import sys, json, time
+from streamlit.testing.v1 import AppTest
+
+started, page = float(sys.argv[1]), sys.argv[2]
+app = AppTest.from_file("streamlit_app.py", default_timeout=120)
+if page != "streamlit_app.py":
+    app.switch_page(page)
+app.secrets["password"] = app.secrets["admin_password"] = "benchmark"
+app.session_state["password_correct"] = app.session_state["is_admin"] = True
+
+start = time.perf_counter()
+app.run()
+first_run = time.perf_counter() - start
+first_paint = time.time() - started
+
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+
+print(json.dumps({"first_paint_s": first_paint, "first_run_s": first_run, "rerun_s": rerun, "exceptions": len(app.exception)}))
+"""
+
+def run_page(page, path):
+    env = {**os.environ, "EURO_PREDICTIONS_BACKEND": "sqlite", "EURO_PREDICTIONS_SQLITE_PATH": path}
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, str(time.time()), page],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/startup-<timestamp>.json)")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "league.sqlite")
+        repo = Repository.SQLiteRepository(path)
+        synthetic.populate(repo, args.members)
+        Common.set_repository(repo)
+        Database.rebuild_points_ledger()
+
+        print(f"{'page':<30} {'first paint (s)':>16} {'first run (s)':>14} {'rerun (s)':>10}")
+        for page in args.pages:
+            runs = [run_page(page, path) for _ in range(args.repeats)]
+            result = {"page": page, **{
+                measure: round(statistics.median(run[measure] for run in runs), 4)
+                for measure in ["first_paint_s", "first_run_s", "rerun_s"]
+            }, "exceptions": max(run["exceptions"] for run in runs)}
+            results.append(result)
+            print(f"{page:<30} {result['first_paint_s']:>16.3f} {result['first_run_s']:>14.3f} {result['rerun_s']:>10.3f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "benchmark": "startup",
+            "started": started.isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "members": args.members,
+            "repeats": args.repeats,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Seeded synthetic Euro tournaments for benchmarking.
+
+`make_tournament(members)` returns the `matches`, `members`, `predictions` and `standings`
+tables as DataFrames: the 51 match fixture list (36 group matches in six groups of four, then the
+round of 16, quarter finals, semi finals and final linked through `next_game`) and one
+prediction per member per match.
+"""
+import numpy as np
+import pandas as pd
+
+TEAMS = [
+    "Germany", "Scotland", "Hungary", "Switzerland",
+    "Spain", "Croatia", "Italy", "Albania",
+    "Slovenia", "Denmark", "Serbia", "England",
+    "Poland", "Netherlands", "Austria", "France",
+    "Belgium", "Slovakia", "Romania", "Ukraine",
+    "Turkey", "Georgia", "Portugal", "Czechia",
+]
+GROUPS = "ABCDEF"
+# The order teams meet in within each group of four
+GROUP_PAIRINGS = [(0, 1), (2, 3), (0, 2), (3, 1), (3, 0), (1, 2)]
+# Winners of each knockout match go to `next_game`, as in the Euro 2024 bracket
+NEXT_GAME = {
+    37: "45-away", 38: "48-away", 39: "45-home", 40: "48-home",
+    41: "46-home", 42: "46-away", 43: "47-home", 44: "47-away",
+    45: "49-home", 46: "49-away", 47: "50-home", 48: "50-away",
+    49: "51-home", 50: "51-away",
+}
+KNOCKOUT_STAGES = [
+    ("Round of 16", range(37, 45)),
+    ("Quarter finals", range(45, 49)),
+    ("Semi finals", range(49, 51)),
+    ("Finals", range(51, 52)),
+]
+
+def _fixtures():
+    fixtures = []
+    start = pd.Timestamp("2024-06-14")
+    for round_index in range(3):
+        for group_index, group in enumerate(GROUPS):
+            for pairing in GROUP_PAIRINGS[round_index * 2:round_index * 2 + 2]:
+                home, away = (TEAMS[group_index * 4 + team] for team in pairing)
+                fixtures.append({"stage": "Group", "group": group, "home": home, "away": away})
+    for stage, numbers in KNOCKOUT_STAGES:
+        fixtures += [{"stage": stage, "group": None, "home": None, "away": None} for _ in numbers]
+
+    matches = pd.DataFrame(fixtures)
+    matches.insert(0, "number", np.arange(1, len(matches) + 1))
+    matches["date"] = [(start + pd.Timedelta(days=int(day))).strftime("%Y-%m-%d") for day in (matches["number"] - 1) // 3]
+    matches["time"] = ["15:00:00", "18:00:00", "21:00:00"] * (len(matches) // 3)
+    matches["stadium"] = "Stadium " + ((matches["number"] % 10) + 1).astype(str)
+    matches["next_game"] = matches["number"].map(NEXT_GAME)
+    return matches
+
+def _play(rng, matches, played):
+    # Group results
+    for column in ["home_goals", "away_goals", "home_penalties", "away_penalties"]:
+        matches[column] = pd.Series([None] * len(matches), dtype="object")
+    is_group = matches["stage"] == "Group"
+    group_played = is_group & (matches["number"] <= played)
+    matches.loc[group_played, "home_goals"] = rng.poisson(1.3, group_played.sum())
+    matches.loc[group_played, "away_goals"] = rng.poisson(1.1, group_played.sum())
+
+    # The round of 16 is drawn from the teams once the group stage is over
+    if played >= 36:
+        qualified = rng.permutation(TEAMS)[:16]
+        round_of_16 = matches["stage"] == "Round of 16"
+        matches.loc[round_of_16, "home"] = qualified[:8]
+        matches.loc[round_of_16, "away"] = qualified[8:]
+
+    # Knockout results, with each winner sent through to the next game
+    for index in matches.index[~is_group & (matches["number"] <= played)]:
+        home_goals, away_goals = (int(goals) for goals in rng.poisson(1.1, 2))
+        matches.loc[index, ["home_goals", "away_goals"]] = [home_goals, away_goals]
+        winner = matches.at[index, "home"] if home_goals > away_goals else matches.at[index, "away"]
+        if home_goals == away_goals:
+            home_penalties = int(rng.integers(2, 6))
+            away_penalties = home_penalties + int(rng.choice([-1, 1]))
+            matches.loc[index, ["home_penalties", "away_penalties"]] = [home_penalties, away_penalties]
+            winner = matches.at[index, "home"] if home_penalties > away_penalties else matches.at[index, "away"]
+        if isinstance(matches.at[index, "next_game"], str):
+            number, side = matches.at[index, "next_game"].split("-")
+            matches.loc[matches["number"] == int(number), side] = winner
+    return matches
+
+def make_tournament(members, played=44, seed=2024):
+    """
+    Builds a synthetic league of `members` members where the first `played` matches have
+    results. By default the group stage and round of 16 are complete.
+    """
+    rng = np.random.default_rng(seed)
+    matches = _play(rng, _fixtures(), played)
+    member_ids = np.arange(1, members + 1)
+
+    members_df = pd.DataFrame({
+        "id": member_ids,
+        "name": [f"Member {member_id}" for member_id in member_ids],
+        "winning_country": rng.choice(TEAMS, members),
+        "winning_team": rng.choice(TEAMS, members),
+    })
+
+    # Everyone predicts the fixture teams of the group stage, and guesses who reaches the knockouts;
+    # a real fixture team is guessed half of the time once it is known
+    rows = members * len(matches)
+    match_index = np.tile(np.arange(len(matches)), members)
+    fixture_home = matches["home"].to_numpy(dtype=object)[match_index]
+    fixture_away = matches["away"].to_numpy(dtype=object)[match_index]
+    is_group = (matches["stage"] == "Group").to_numpy()[match_index]
+    home_guess = rng.choice(TEAMS, rows).astype(object)
+    away_guess = rng.choice(TEAMS, rows).astype(object)
+    use_home = is_group | (pd.notna(fixture_home) & (rng.random(rows) < 0.5))
+    use_away = is_group | (pd.notna(fixture_away) & (rng.random(rows) < 0.5))
+
+    predictions = pd.DataFrame({
+        "member_id": np.repeat(member_ids, len(matches)),
+        "match_number": matches["number"].to_numpy()[match_index],
+        "home_team_prediction": np.where(use_home, fixture_home, home_guess),
+        "home_goals_prediction": rng.poisson(1.4, rows),
+        "away_team_prediction": np.where(use_away, fixture_away, away_guess),
+        "away_goals_prediction": rng.poisson(1.1, rows),
+    })
+
+    standings = pd.DataFrame({"member_id": member_ids})
+    for column in ["group_home_goals", "group_away_goals", "group_result", "group_perfect_prediction", "tournament_winner"]:
+        standings[column] = 0
+
+    return {"matches": matches, "members": members_df, "predictions": predictions, "standings": standings}
+
+def populate(repo, members, played=44, seed=2024, chunk_size=50_000):
+    """Loads a synthetic tournament into `repo` and returns the generated tables."""
+    tables = make_tournament(members, played=played, seed=seed)
+    for table, df in tables.items():
+        df = df.astype(object).where(df.notna(), None)
+        for start in range(0, len(df), chunk_size):
+            repo.upsert(table, df.iloc[start:start + chunk_size].to_dict("records"))
+    return tables
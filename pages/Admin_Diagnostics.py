@@ -0,0 +1,92 @@
+import Common
+import Instrumentation
+import json
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+st.set_page_config(
+    page_title="Diagnostics",
+    page_icon="🩺",
+    layout="wide",
+    initial_sidebar_state="expanded",
+)
+if not Common.check_password(): st.stop()
+Common.print_menu()
+if not st.session_state.get("is_admin"):
+    st.error("Only administrators can see the diagnostics")
+    st.stop()
+
+st.header("🩺 Diagnostics", divider="red")
+
+traces = pd.DataFrame(Instrumentation.get_traces(), columns=["time", "kind", "name", "table", "section", "seconds", "rows", "payload_bytes", "cache"])
+if traces.empty:
+    st.markdown("<h3 style='text-align: center;'><em>Nothing has been traced yet, open a few pages first.</em></h3>", unsafe_allow_html=True)
+    st.stop()
+traces["time"] = pd.to_datetime(traces["time"], unit="s")
+traces["ms"] = traces["seconds"] * 1000
+st.caption(f"The last {len(traces):,} traced calls since {traces['time'].min():%d %B %H:%M:%S}, across every session.")
+
+# Totals per kind of call
+queries = traces[traces["kind"] == "query"]
+caches = traces[traces["kind"] == "cache"]
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Queries", f"{len(queries):,}")
+col2.metric("Query time", f"{queries['seconds'].sum():.2f} s")
+col3.metric("Rows fetched", f"{int(queries['rows'].sum()):,}")
+col4.metric("Cache hit rate", f"{(caches['cache'] == 'hit').mean():.0%}" if len(caches) else "-")
+
+# Latency and volume per call
+st.subheader("Calls", divider="grey")
+kind = st.radio("Show", ["section", "query", "cache"], format_func=lambda kind: {"section": "Page sections", "query": "Queries", "cache": "Cached reads"}[kind], horizontal=True)
+calls = traces[traces["kind"] == kind]
+group = ["name", "table"] if kind == "query" else ["name"]
+summary = calls.groupby(group, dropna=False).agg(
+    calls=("ms", "size"),
+    total_ms=("ms", "sum"),
+    mean_ms=("ms", "mean"),
+    p50_ms=("ms", "median"),
+    p95_ms=("ms", lambda ms: ms.quantile(0.95)),
+    max_ms=("ms", "max"),
+    rows=("rows", "sum"),
+    payload_kb=("payload_bytes", lambda payload: payload.sum() / 1024),
+    hits=("cache", lambda cache: (cache == "hit").sum()),
+).reset_index().sort_values("total_ms", ascending=False)
+st.dataframe(summary, use_container_width=True, hide_index=True, column_config={
+    column: st.column_config.NumberColumn(format="%.1f") for column in ["total_ms", "mean_ms", "p50_ms", "p95_ms", "max_ms", "payload_kb"]
+})
+
+# Latency histogram on a log scale, 1ms to 10s
+st.subheader("Latency", divider="grey")
+bins = np.logspace(0, 4, 17)
+labels = [f"{low:.0f}-{high:.0f} ms" if low >= 10 else f"{low:.1f}-{high:.1f} ms" for low, high in zip(bins[:-1], bins[1:])]
+histogram = pd.DataFrame({
+    name: pd.cut(ms.clip(bins[0], bins[-1] - 1e-9), bins, labels=labels, include_lowest=True).value_counts().reindex(labels)
+    for name, ms in calls.groupby("name")["ms"]
+})
+st.bar_chart(histogram)
+
+# The slowest recent calls
+st.subheader("Slowest calls", divider="grey")
+st.dataframe(
+    traces.nlargest(20, "seconds"),
+    use_container_width=True,
+    hide_index=True,
+    column_order=["time", "kind", "section", "name", "table", "ms", "rows", "payload_bytes", "cache"],
+    column_config={"ms": st.column_config.NumberColumn(format="%.1f")},
+)
+
+# Export
+st.subheader("Traces", divider="grey")
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button(
+        "Download traces (JSONL)",
+        "".join(json.dumps(trace) + "\n" for trace in Instrumentation.get_traces()),
+        file_name="traces.jsonl",
+        mime="application/jsonl",
+    )
+with col2:
+    if st.button("Clear traces", key="clear_traces_button"):
+        Instrumentation.clear()
+        st.rerun()
@@ -1,8 +1,14 @@
 import Common
 import Database
+import Instrumentation
+import Jobs
+import Versions
+import pandas as pd
 import streamlit as st
+import csv
+import json
+from io import StringIO
 from datetime import date
-from st_supabase_connection import execute_query
 
 st.set_page_config(
     page_title="Update match scores",
@@ -12,17 +18,22 @@ st.set_page_config(
 )
 if not Common.check_password(): st.stop()
 Common.print_menu()
-client = Common.get_database_client()
+repo = Common.get_repository()
+if repo.read_only:
+    st.error("Scores can't be updated while the app is serving a read-only snapshot")
+    st.stop()
+jobs = Jobs.start()
 
 ####################################################################################################
 # Database
 ####################################################################################################
 
-@st.cache_data(ttl=300)
 def get_played_matches():
-    today = date.today()
+    return _get_played_matches(date.today(), Versions.get("matches"))
 
-    data = execute_query(client.table("matches").select(
+@Instrumentation.cached(st.cache_data(max_entries=4))
+def _get_played_matches(today, version):
+    data = repo.select("matches",
         "number",
         "date",
         "home",
@@ -30,8 +41,9 @@ def get_played_matches():
         "home_goals",
         "away_goals",
         "stage",
-        "next_game"
-    ).order("number")).data
+        "next_game",
+        order="number"
+    )
 
     data = [match for match in data if match["date"] <= str(today)] # Filter out matches that haven't happened yet
     data = data[::-1] # Reverse the list to show the latest matches first
@@ -78,16 +90,72 @@ away_penalties = None
 if selected_match_details["stage"] != "Group" and home_score == away_score:
     col3, col4 = st.columns(2)
     with col3:
-        home_penalties = st.text_input(f"{selected_match_details['home']} Penalties", placeholder="0")
+        home_penalties = st.text_input(f"{selected_match_details['home']} Penalties", placeholder="0", key="home_penalties")
     with col4:
-        away_penalties = st.text_input(f"{selected_match_details['away']} Penalties", placeholder="0")
+        away_penalties = st.text_input(f"{selected_match_details['away']} Penalties", placeholder="0", key="away_penalties")
 
-# Button to update the scores
+# Button to update the scores, the save itself happens in the background (see `Jobs`)
 if st.button("Update Scores", key="update_button", help="Click to update the scores", disabled=(home_score == "" and away_score == "")):
-    execute_query(client.table("matches").update({"home_goals": home_score, "away_goals": away_score}).eq("number", selected_match_id))
-    if selected_match_details["stage"] != "Group" and home_penalties != "" and away_penalties != "":
-        execute_query(client.table("matches").update({"home_penalties": home_penalties, "away_penalties": away_penalties}).eq("number", selected_match_id))
-    Database.update_standings(selected_match_details["stage"], selected_match_details["home"], selected_match_details["away"], home_score, away_score, home_penalties, away_penalties, selected_match_details["next_game"])
-    st.cache_data.clear()
-    st.cache_resource.clear()
-    st.success("Scores updated successfully! 🎉")
+    result = {"number": selected_match_id, "home_goals": home_score, "away_goals": away_score, "home_penalties": home_penalties, "away_penalties": away_penalties}
+    # Catch typos now rather than when the worker gets to it
+    _, errors = Database.prepare_results(pd.DataFrame([result], columns=Database.RESULT_COLUMNS, dtype=str))
+    if errors:
+        st.error("The score wasn't saved:\n\n" + "\n".join(f"- {error.removeprefix('Row 1: ')}" for error in errors))
+    else:
+        jobs.enqueue(result)
+        st.success("Scores queued, the standings will update in a few seconds! 🎉")
+
+# Saves waiting for or done by the background worker
+st.subheader("Score saves", divider="grey")
+recent_jobs = jobs.recent()
+if recent_jobs.empty:
+    st.caption("No scores have been saved since the queue was created.")
+else:
+    recent_jobs["score"] = [
+        f"{result['home_goals']} : {result['away_goals']}" + (f" ({result['home_penalties']} : {result['away_penalties']} pens)" if result.get("home_penalties") else "")
+        for result in map(json.loads, recent_jobs["result"])
+    ]
+    st.dataframe(
+        recent_jobs,
+        use_container_width=True,
+        hide_index=True,
+        column_order=["id", "match_number", "score", "status", "attempts", "error", "queued_at", "updated_at"],
+    )
+    st.button("Refresh", key="refresh_jobs_button", help=f"{jobs.pending()} save(s) still to do")
+
+# Import several results at once, e.g. a whole match day or a backfill
+st.subheader("Bulk import results", divider="grey")
+uploaded_results = st.file_uploader("Upload a CSV of results", type="csv")
+pasted_results = st.text_area(
+    "Or paste a table of results",
+    placeholder="number,home_goals,away_goals,home_penalties,away_penalties\n37,1,1,4,3\n38,2,0,,"
+)
+if uploaded_results is not None or pasted_results.strip():
+    try:
+        # Let pandas work out whether the table uses commas, tabs or semicolons
+        results = pd.read_csv(uploaded_results if uploaded_results is not None else StringIO(pasted_results.strip()), sep=None, engine="python", dtype=str, skipinitialspace=True)
+        # Pasted headers often have spaces around the names, e.g. "number, home_goals, away_goals"
+        results = results.rename(columns=str.strip)
+    except (ValueError, csv.Error) as e:
+        st.error(f"Couldn't read the results: {e}")
+        results = None
+
+    if results is not None:
+        st.dataframe(results, use_container_width=True, hide_index=True)
+        if st.button("Import results", key="import_button", help="Save every result above and update the standings once"):
+            errors = Database.import_results(results)
+            if errors:
+                st.error("Nothing was imported:\n\n" + "\n".join(f"- {error}" for error in errors))
+            else:
+                st.success(f"{len(results)} result{'' if len(results) == 1 else 's'} imported successfully! 🎉")
+
+# Rebuild the group standings from every played match, e.g. after scores were edited in the database directly
+st.subheader("Reconcile standings", divider="grey")
+if st.button("Recompute group standings", key="recompute_button", help="Re-score every group match from scratch"):
+    Database.recompute_group_standings()
+    st.success("Group standings recomputed! 🎉")
+
+# Rebuild the points behind the position history, e.g. after the round of 16 teams were entered in the database
+if st.button("Rebuild points ledger", key="rebuild_ledger_button", help="Re-score every match into the points ledger"):
+    Database.rebuild_points_ledger()
+    st.success("Points ledger rebuilt! 🎉")
@@ -1,6 +1,9 @@
 import Common
+import Database
+import Instrumentation
+import Scoring
+import Styling
 import streamlit as st
-from st_supabase_connection import execute_query
 import pandas as pd
 
 st.set_page_config(
@@ -11,25 +14,14 @@ st.set_page_config(
 )
 if not Common.check_password(): st.stop()
 Common.print_menu()
-client = Common.get_database_client()
 
-# Fetch the matches to use later
-matches = execute_query(client.table("matches").select(
-    "number",
-    "home",
-    "home_goals",
-    "away",
-    "away_goals",
-    "group",
-    "stage"
-).order("number")).data
+# Get the matches, with their display columns, to use later, shared by every session
+matches = Database.get_fixtures()[["number", "home", "home_goals", "away", "away_goals", "score", "stage"]]
 
 st.header("🧠 Predictions", divider="blue")
 
 # Fetch members with their IDs and names
-members_data = execute_query(client.table("members").select(
-    "id", "name", "winning_country"
-).order("name")).data
+members_data = Database.get_members()
 
 # Create a dictionary mapping member names to their IDs
 members_dict = {member["name"]: member["id"] for member in members_data}
@@ -39,97 +31,29 @@ selected_member_name = st.selectbox(
     "Who would you like to view predictions for?",
     list(members_dict.keys())
 )
+prefetch = st.toggle("Load everyone", help="Load every member's predictions at once, so switching between members is instant")
 
 # Get the selected member's ID
 selected_member_id = members_dict[selected_member_name]
 
 # Fetch predictions for the selected member
-data = execute_query(client.table("predictions").select(
-    "match_number",
-    "home_goals_prediction",
-    "away_goals_prediction",
-    "home_team_prediction",
-    "away_team_prediction"
-).eq("member_id", selected_member_id)
-.order("match_number")).data
+with Instrumentation.section("Predictions / Data"):
+    data = Database.get_member_predictions(selected_member_id, prefetch=prefetch)
 
-# Join the matches and data lists
-joined_data = [
-    {**match, **prediction}
-    for match in matches
-    for prediction in data
-    if match["number"] == prediction["match_number"]
-]
-df = pd.DataFrame(joined_data)
+    # Join the matches and predictions on the match number
+    df = pd.merge(matches, data, left_on='number', right_on='match_number').rename(columns={'score': 'actual_score'})
+    df['predicted_score'] = Database.format_score(df['home_goals_prediction'], df['away_goals_prediction'])
 
-# Set column data types
-df['home_goals'] = df['home_goals'].astype('Int64')
-df['away_goals'] = df['away_goals'].astype('Int64')
-df['actual_score'] = df.apply(lambda x: None if pd.isna(x['home_goals']) else str(x['home_goals']) + " : " + str(x['away_goals']), axis=1)
-df['home_goals_prediction'] = df['home_goals_prediction'].astype('Int64')
-df['away_goals_prediction'] = df['away_goals_prediction'].astype('Int64')
-df['predicted_score'] = df.apply(lambda x: None if pd.isna(x['home_goals_prediction']) else str(x['home_goals_prediction']) + " : " + str(x['away_goals_prediction']), axis=1)
-df['stage'] = df.apply(lambda x: x['stage'] if pd.isna(x['group']) else f"{x['stage']} {x['group']}", axis=1)
+    styled_df = df.style.apply(Styling.prediction_styles, axis=None)
 
-# Styling the dataframe
-def style_row(row):
-    # Default styles
-    styles = [''] * len(row)
-
-    # If the correct home_team_prediction is predicted
-    if row['home'] == row['home_team_prediction']:
-        styles[10] = 'background-color: green'  # home_team_prediction
-    
-    # If the correct away_team_prediction is predicted
-    if row['away'] == row['away_team_prediction']:
-        styles[11] = 'background-color: green'  # away_team_prediction
-
-    # If both teams are predicted correctly
-    if row['home'] == row['home_team_prediction'] and row['away'] == row['away_team_prediction']:
-        styles[10] = 'background-color: orange'  # home_team_prediction
-        styles[11] = 'background-color: orange'  # away_team_prediction
-
-    # If the game hasn't been played yet
-    if pd.isna(row['home_goals']):
-        return styles
-
-    # If the correct winner is predicted
-    if (row['home_goals'] > row['away_goals'] and row['home_goals_prediction'] > row['away_goals_prediction']) or \
-       (row['home_goals'] < row['away_goals'] and row['home_goals_prediction'] < row['away_goals_prediction']) or \
-       (row['home_goals'] == row['away_goals'] and row['home_goals_prediction'] == row['away_goals_prediction']):
-        styles[0] = 'background-color: green'  # number
-        if row['home_goals'] == row['home_goals_prediction']:
-            styles[1] = 'background-color: green'  # home
-            styles[2] = 'background-color: green'  # predicted_score
-        if row['away_goals'] == row['away_goals_prediction']:
-            styles[3] = 'background-color: green'  # away
-            styles[2] = 'background-color: green'  # predicted_score
-    else:
-        styles[0] = 'background-color: red'  # number
-        if row['home_goals'] == row['home_goals_prediction']:
-            styles[1] = 'background-color: green'  # home
-            styles[2] = 'background-color: green'  # predicted_score
-        if row['away_goals'] == row['away_goals_prediction']:
-            styles[3] = 'background-color: green'  # away
-            styles[2] = 'background-color: green'  # predicted_score
-
-    # If the perfect score is predicted
-    if row['home_goals'] == row['home_goals_prediction'] and row['away_goals'] == row['away_goals_prediction']:
-        styles[0] = 'background-color: orange'  # number
-        styles[1] = 'background-color: orange'  # home
-        styles[3] = 'background-color: orange'  # away
-
-    return styles
-
-styled_df = df.style.apply(style_row, axis=1)
-
-st.dataframe(
-    styled_df,
-    use_container_width=True,
-    height=800, 
-    hide_index=True,
-    column_order=['number', 'home', 'away', 'actual_score', 'predicted_score', 'home_team_prediction', 'away_team_prediction']
-)
+with Instrumentation.section("Predictions / Table"):
+    st.dataframe(
+        styled_df,
+        use_container_width=True,
+        height=800, 
+        hide_index=True,
+        column_order=['number', 'home', 'away', 'actual_score', 'predicted_score', 'home_team_prediction', 'away_team_prediction']
+    )
 
 # Add a section at the bottom of the webpage to explain the colorings and rules
 st.markdown("""
@@ -140,3 +64,61 @@ st.markdown("""
 - <span style='color:green'>**Green predicted team**</span>: The correct team was predicted for this match.
 - <span style='color:red'>**Red number**</span>: The predicted result was wrong.
 """, unsafe_allow_html=True)
+
+# What everyone predicted for a match, looked up from the consensus shared by every session
+with Instrumentation.section("Predictions / Consensus"):
+    st.subheader("What did everyone predict?", divider="blue")
+    match_labels = {
+        int(match.number): f"{match.number}: {match.home} vs {match.away}" if pd.notna(match.home) and pd.notna(match.away) else f"{match.number}: {match.stage}"
+        for match in matches.itertuples()
+    }
+    # Start on the next match to be played
+    unplayed = matches.index[matches['home_goals'].isna()]
+    selected_match = st.selectbox(
+        "Which match?",
+        list(match_labels),
+        index=matches.index.get_loc(unplayed[0]) if len(unplayed) else len(matches) - 1,
+        format_func=match_labels.get,
+    )
+    consensus = Database.get_match_consensus(selected_match)
+
+    if consensus is None:
+        st.markdown("<h3 style='text-align: center;'><em>Nobody has predicted this match yet.</em></h3>", unsafe_allow_html=True)
+    else:
+        st.caption(f"{consensus['predictions']} members predicted the score of this match.")
+        outcomes = consensus['outcomes']
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Home win", f"{outcomes['home']:.0%}")
+        col2.metric("Draw", f"{outcomes['draw']:.0%}")
+        col3.metric("Away win", f"{outcomes['away']:.0%}")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            scorelines = consensus['scorelines'].head(10)
+            st.markdown("**Most predicted scores**")
+            st.dataframe(
+                scorelines.assign(score=scorelines['home_goals_prediction'].astype(str) + " : " + scorelines['away_goals_prediction'].astype(str)),
+                use_container_width=True,
+                hide_index=True,
+                column_order=["score", "members", "share"],
+                column_config={"share": st.column_config.ProgressColumn("share", format="%.2f", min_value=0, max_value=1)},
+            )
+        with col2:
+            if consensus['teams'] is not None:
+                st.markdown("**Most picked teams for this stage**")
+                st.dataframe(
+                    consensus['teams'].head(10),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={"share": st.column_config.ProgressColumn("share", format="%.2f", min_value=0, max_value=1)},
+                )
+            if consensus['hits']:
+                st.markdown("**Members who scored**")
+                st.dataframe(
+                    pd.DataFrame(
+                        [(category.replace('_', ' ').capitalize(), consensus['hits'][category]) for category in Scoring.CATEGORIES if category in consensus['hits']],
+                        columns=["category", "members"],
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
@@ -0,0 +1,2 @@
+-- Send changes to the app's tables over Supabase Realtime, see ChangeFeed.SupabaseChangeFeed.
+alter publication supabase_realtime add table matches, members, predictions, standings, points_ledger;
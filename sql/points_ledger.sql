@@ -0,0 +1,12 @@
+-- Hits per member, match and scoring category, see Database.update_points_ledger.
+create table if not exists points_ledger (
+    member_id integer not null,
+    match_number integer not null,
+    category text not null,
+    hits integer not null,
+    primary key (member_id, match_number, category)
+);
+create index if not exists points_ledger_match_number on points_ledger (match_number);
+
+-- Scoring a single match reads its predictions across every member
+create index if not exists predictions_match_number on predictions (match_number);
@@ -1,9 +1,10 @@
 import Common
 import Database
-import pandas as pd
+import Instrumentation
+import Styling
+import Versions
 import streamlit as st
 from datetime import date
-from st_supabase_connection import execute_query
 
 st.set_page_config(
     page_title="Euro 2024 - Dashboard",
@@ -13,28 +14,22 @@ st.set_page_config(
 )
 if not Common.check_password(): st.stop()
 Common.print_menu()
-client = Common.get_database_client()
 today = date.today()
 
 ####################################################################################################
 # Database
 ####################################################################################################
 
-@st.cache_data(ttl=300)
+# Every table the dashboard reads, fetched together when they aren't cached yet
+TABLES = ["matches", "members", "points_ledger"]
+
 def get_todays_matches():
-    today_data = execute_query(client.table("matches").select(
-        "date",
-        "time",
-        "stage",
-        "group",
-        "home", 
-        "away", 
-        "home_goals", 
-        "away_goals", 
-        "stadium"
-    ).eq("date", today).order("time")).data
-    today_df = pd.DataFrame(today_data)
-    return today_df
+    return _get_todays_matches(today, Versions.get("matches"))
+
+@Instrumentation.cached(st.cache_resource(max_entries=2))
+def _get_todays_matches(today, version):
+    matches = Database.get_matches()
+    return matches[matches['date'] == today.isoformat()].sort_values('time', kind='stable')
 
 ####################################################################################################
 # Page content
@@ -43,65 +38,89 @@ def get_todays_matches():
 st.title("2024 European Championships ⚽")
 st.subheader("Welcome to the Williams Euro predictions tracker", divider="rainbow")
 
+with Instrumentation.section("Dashboard / Prefetch"):
+    Database.prefetch(*TABLES)
+
 # Today's matches
 st.subheader(":calendar: Today's Matches", divider="grey")
 
-today_df = get_todays_matches()
-if today_df.empty:
-    st.markdown("<h3 style='text-align: center;'><em>There are no matches scheduled for today</em> 😢</h3>", unsafe_allow_html=True)
-else:
-    today_df['home_goals'] = today_df['home_goals'].astype('Int64')
-    today_df['away_goals'] = today_df['away_goals'].astype('Int64')
-    today_df['score'] = today_df.apply(lambda x: None if pd.isna(x['home_goals']) else str(x['home_goals']) + " : " + str(x['away_goals']), axis=1)
-    today_df['date'] = pd.to_datetime(today_df['date']).dt.strftime('%d %B')
-    today_df['uk_time'] = pd.to_datetime(today_df['time'], format="mixed").dt.strftime('%H:%M')
-    today_df['stage'] = today_df.apply(lambda x: x['stage'] if pd.isna(x['group']) else f"{x['stage']} {x['group']}", axis=1)
-    st.dataframe(today_df, use_container_width=True, hide_index=True, column_order=['date', 'uk_time', 'home', 'score', 'away', 'stage', 'stadium'])
+with Instrumentation.section("Dashboard / Today's matches"):
+    today_df = get_todays_matches()
+    if today_df.empty:
+        st.markdown("<h3 style='text-align: center;'><em>There are no matches scheduled for today</em> 😢</h3>", unsafe_allow_html=True)
+    else:
+        today_df = Database.format_matches(today_df)
+        st.dataframe(today_df, use_container_width=True, hide_index=True, column_order=['date', 'uk_time', 'home', 'score', 'away', 'stage', 'stadium'])
 
 # Standings
 st.subheader(":trophy: Prediction Standings", divider="blue")
-standings = Database.get_standings()
-
-# Get knockout round points
-knockout_round_points = Database.get_knockout_round_points()
-standings = standings.merge(knockout_round_points, on='member_id', how='left')
-
-# Get the total points
-member_standings = Database.get_standings_totals(standings)
-
-### Styling
-# Highlight the highest score in each column in green
-def highlight_max(s):
-    if pd.isna(s).all() or s.max() == 0:
-        return ['' for _ in s]
-    is_max = s == s.max()
-    return ['background-color: green' if v else '' for v in is_max]
-
-# Add medals
-member_standings.loc[member_standings['position'] == 1, 'position'] = '🥇'
-member_standings.loc[member_standings['position'] == 2, 'position'] = '🥈'
-member_standings.loc[member_standings['position'] == 3, 'position'] = '🥉'
-
-# Only show the knockout round columns if the tournament has reached that stage
-if today < date(2024, 6, 30):
-    # Hide the quarter finals, semifinals and finals columns if the tournament has not reached that stage
-    member_standings = member_standings[[ 'position', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'total' ]]
-    member_standings = member_standings.style.apply(highlight_max, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16'])
-elif today < date(2024, 7, 3):
-    # Hide the semifinals and finals columns if the tournament has not reached that stage
-    member_standings = member_standings[[ 'position', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'total' ]]
-    member_standings = member_standings.style.apply(highlight_max, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals'])
-elif today < date(2024, 7, 6):
-    # Hide the finals column if the tournament has not reached that stage
-    member_standings = member_standings[[ 'position', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals', 'total' ]]
-    member_standings = member_standings.style.apply(highlight_max, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals'])
-else:
-    # Show all columns
-    member_standings = member_standings.style.apply(highlight_max, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals', 'finals', 'total'])
-
-st.dataframe(
-    member_standings,
-    height=702,
-    use_container_width=True, 
-    hide_index=True,
-)
+with Instrumentation.section("Dashboard / Standings"):
+    # Ranked, with medals and movement arrows, once for every session
+    member_standings = Database.get_leaderboard()
+
+    # Only show the knockout round columns if the tournament has reached that stage
+    if today < date(2024, 6, 30):
+        # Hide the quarter finals, semifinals and finals columns if the tournament has not reached that stage
+        member_standings = member_standings[[ 'position', 'movement', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'total' ]]
+        member_standings = member_standings.style.apply(Styling.max_styles, axis=None, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16'])
+    elif today < date(2024, 7, 3):
+        # Hide the semifinals and finals columns if the tournament has not reached that stage
+        member_standings = member_standings[[ 'position', 'movement', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'total' ]]
+        member_standings = member_standings.style.apply(Styling.max_styles, axis=None, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals'])
+    elif today < date(2024, 7, 6):
+        # Hide the finals column if the tournament has not reached that stage
+        member_standings = member_standings[[ 'position', 'movement', 'name', 'group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals', 'total' ]]
+        member_standings = member_standings.style.apply(Styling.max_styles, axis=None, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals'])
+    else:
+        # Show all columns
+        member_standings = member_standings[Database.LEADERBOARD_COLUMNS]
+        member_standings = member_standings.style.apply(Styling.max_styles, axis=None, subset=['group_goals', 'group_result', 'group_perfect', 'round_of_16', 'quarter_finals', 'semi_finals', 'finals', 'total'])
+
+with Instrumentation.section("Dashboard / Standings table"):
+    st.dataframe(
+        member_standings,
+        height=702,
+        use_container_width=True, 
+        hide_index=True,
+    )
+
+# Who can still win, from simulating the matches left to play
+with Instrumentation.section("Dashboard / Who can still win"):
+    fixtures = Database.get_matches()
+    if fixtures['home_goals'].isna().any():
+        st.subheader(":crystal_ball: Who can still win?", divider="violet")
+        with st.spinner("Simulating the rest of the tournament..."):
+            simulation = Database.get_simulation()
+        simulation = simulation[simulation['best_position'] == 1].sort_values('win_probability', ascending=False)
+        simulation['win_probability'] = simulation['win_probability'] * 100
+        st.dataframe(
+            simulation,
+            use_container_width=True,
+            hide_index=True,
+            column_order=['name', 'win_probability', 'expected_position', 'positions'],
+            column_config={
+                'name': 'Name',
+                'win_probability': st.column_config.ProgressColumn('Chance of winning', format="%.1f%%", min_value=0, max_value=100),
+                'expected_position': st.column_config.NumberColumn('Average position', format="%.1f"),
+                'positions': st.column_config.BarChartColumn('Chance of each top 10 position', y_min=0, y_max=1),
+            },
+        )
+        st.caption("Members who finished first in at least one of the simulated endings to the tournament.")
+
+# Position after each played match
+with Instrumentation.section("Dashboard / Position history"):
+    history = Database.get_position_history()
+    if history.shape[1] > 1:
+        # Charts need Altair, which is slow to import, so only draw it when asked for
+        if st.toggle(":chart_with_upwards_trend: Show position history", key="history_toggle"):
+            import altair as alt
+
+            names = {member["id"]: member["name"] for member in Database.get_members()}
+            history = history.rename(index=names).T.rename_axis('match').reset_index().melt(id_vars='match', var_name='name', value_name='position')
+            chart = alt.Chart(history).mark_line(point=True).encode(
+                x=alt.X('match:O', title='Match'),
+                y=alt.Y('position:Q', title='Position', scale=alt.Scale(reverse=True)),
+                color=alt.Color('name:N', title='Member'),
+                tooltip=['name', 'match', 'position'],
+            )
+            st.altair_chart(chart, use_container_width=True)